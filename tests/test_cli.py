@@ -0,0 +1,387 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+WALKDIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'walkdir.py')
+
+def _run(*args) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, WALKDIR] + list(args), capture_output=True, text=True, errors='surrogateescape', timeout=120)
+
+def _make_deep(root: str, levels: int = 25):
+    """
+    Nest directories until their path is longer than PATH_MAX, so that listing
+    the deepest one by path fails with ENAMETOOLONG.
+    """
+    fd: int = os.open(root, os.O_RDONLY)
+    try:
+        for i in range(levels):
+            name: str = f'd{i:02d}' * 60
+            os.mkdir(name, dir_fd=fd)
+            sub: int = os.open(name, os.O_RDONLY, dir_fd=fd)
+            os.close(fd)
+            fd = sub
+        os.close(os.open('f.txt', os.O_CREAT | os.O_WRONLY, dir_fd=fd))
+    finally:
+        os.close(fd)
+
+class TestImport(unittest.TestCase):
+    # Cumulative `import walkdir` time budget, in microseconds
+    BUDGET: int = 30000
+
+    def _import(self, cache: str) -> tuple:
+        # Imported from bytecode, as an installed walkdir is, even where PYTHONDONTWRITEBYTECODE is set
+        env: dict = {k: v for k, v in os.environ.items() if k != 'PYTHONDONTWRITEBYTECODE'}
+        env['PYTHONPYCACHEPREFIX'] = cache
+        p = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import sys, walkdir; print(" ".join(sorted(sys.modules)))'], capture_output=True, text=True, timeout=60, cwd=os.path.dirname(WALKDIR), env=env)
+        self.assertEqual(p.returncode, 0, p.stderr)
+        line: str = [l for l in p.stderr.splitlines() if l.endswith('| walkdir')][0]
+        return int(line.split('|')[1]), p.stdout.split()
+
+    def test_import_is_fast_and_lazy(self):
+        # The best of a few runs, so that a busy machine does not fail the budget
+        timings: list = []
+        with tempfile.TemporaryDirectory() as cache:
+            for i in range(5):
+                cumulative, modules = self._import(cache)
+                timings.append(cumulative)
+                for module in ['xlsxwriter', 'sqlite3', 'json']:
+                    self.assertNotIn(module, modules)
+        self.assertLess(min(timings), TestImport.BUDGET)
+
+class TestArguments(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        for name in ['print', '-data', 'x']:
+            os.mkdir(os.path.join(self._tmp.name, name))
+            with open(os.path.join(self._tmp.name, name, f'in{name}.txt'), 'w') as f:
+                f.write('hello')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _run_in_tmp(self, *args) -> subprocess.CompletedProcess:
+        return subprocess.run([sys.executable, WALKDIR] + list(args), capture_output=True, text=True, timeout=120, cwd=self._tmp.name)
+
+    def test_directories_named_like_commands_or_options(self):
+        for args, walked in [(('print', 'print'), ['print']),
+                             (('-data', 'print'), ['-data']),
+                             (('x', '-data', 'print'), ['x', '-data']),
+                             (('x', 'print', '--', 'print'), ['x', 'print'])]:
+            with self.subTest(args=args):
+                p = self._run_in_tmp(*args)
+                self.assertEqual(p.returncode, 0, p.stdout)
+                for name in walked:
+                    self.assertIn(f'in{name}.txt', p.stdout)
+
+class TestWalkErrors(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root: str = self._tmp.name
+        with open(os.path.join(self.root, 'a.txt'), 'w') as f:
+            f.write('hello')
+
+    def tearDown(self):
+        for path, dirs, files in os.walk(self.root):
+            for d in dirs:
+                try:
+                    os.chmod(os.path.join(path, d), 0o755)
+                except OSError:
+                    pass
+        self._tmp.cleanup()
+
+    def test_too_long_path_is_reported_and_walk_succeeds(self):
+        _make_deep(self.root)
+        p = _run(self.root, 'print', '-r')
+        self.assertEqual(p.returncode, 0, p.stdout)
+        self.assertIn('ENAMETOOLONG', p.stdout)
+        self.assertIn('finished (success)', p.stdout)
+
+    @unittest.skipIf(os.geteuid() == 0, 'root can list unreadable directories')
+    def test_unreadable_directory_is_reported_and_walk_succeeds(self):
+        locked: str = os.path.join(self.root, 'locked')
+        os.mkdir(locked)
+        os.chmod(locked, 0)
+        for args in [(), ('--fd-walk',)]:
+            p = _run(self.root, 'print', '-r', *args)
+            self.assertEqual(p.returncode, 0, p.stdout)
+            self.assertIn('EACCES', p.stdout)
+
+class TestFollowLinks(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root: str = os.path.join(self._tmp.name, 'tree')
+        os.makedirs(os.path.join(self.root, 'zz', 'sub'))
+        with open(os.path.join(self.root, 'zz', 'file'), 'w') as f:
+            f.write('hello')
+        # Listed before the folder it points to, and a loop back to it
+        os.symlink('zz', os.path.join(self.root, 'aa'))
+        os.symlink('..', os.path.join(self.root, 'zz', 'sub', 'up'))
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_folder_keeps_its_contents_and_links_are_not_errors(self):
+        import csv
+        for mode in [(), ('--fd-walk',), ('--traversal', 'bfs'), ('--traversal', 'bfs', '--fd-walk')]:
+            with self.subTest(mode=mode):
+                out: str = os.path.join(self._tmp.name, 'out.csv')
+                p = _run(self.root, 'print', '-r', '-L', *mode, '-o', out)
+                self.assertEqual(p.returncode, 0, p.stdout)
+                self.assertNotIn('ELOOP', p.stdout)
+                with open(out, newline='') as f:
+                    rows: dict = {row['Fullpath']: row for row in csv.DictReader(f)}
+                self.assertEqual(rows[os.path.join(self.root, 'zz')]['Size'], '5')
+                self.assertEqual(rows[os.path.join(self.root, 'aa')]['Size'], '0')
+                self.assertIn(os.path.join(self.root, 'zz', 'file'), rows)
+                self.assertNotIn('Failed', [row['Result'] for row in rows.values()])
+
+class TestNonUtf8Names(unittest.TestCase):
+    """
+    Names that are not valid UTF-8 reach Python as lone surrogates.
+    """
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root: str = self._tmp.name
+        root: bytes = os.fsencode(self.root)
+        os.mkdir(os.path.join(root, b'd\xfe'))
+        for name in [b'bad\xff.txt', b'ok.txt']:
+            with open(os.path.join(root, b'd\xfe', name), 'w') as f:
+                f.write('hello')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_sqlite_keeps_raw_names(self):
+        import sqlite3
+        db_file: str = os.path.join(self.root, 'out.sqlite')
+        p = _run(self.root, 'print', '-r', '-x', '*.sqlite', '-o', db_file)
+        self.assertEqual(p.returncode, 0, p.stdout)
+        db = sqlite3.connect(db_file)
+        try:
+            paths: list = [row[0] for row in db.execute('SELECT raw_path FROM paths')]
+            names: list = [row[0] for row in db.execute('SELECT name FROM items')]
+        finally:
+            db.close()
+        self.assertIn(os.path.join(os.fsencode(self.root), b'd\xfe', b'bad\xff.txt'), paths)
+        self.assertIn('bad\\xff.txt', names)
+
+    def test_spilled_walk_keeps_names(self):
+        spilled = _run(self.root, 'print', '-r', '--memory-limit', '1')
+        walked = _run(self.root, 'print', '-r')
+        self.assertEqual(spilled.returncode, 0, spilled.stdout)
+        self.assertIn('bad\udcff.txt', spilled.stdout)
+        self.assertEqual(spilled.stdout.count('bad'), walked.stdout.count('bad'))
+
+class TestHtmlReport(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root: str = os.path.join(self._tmp.name, 'tree')
+        os.makedirs(os.path.join(self.root, 'a'))
+        for name in ['t.txt', os.path.join('a', 'x.txt')]:
+            with open(os.path.join(self.root, name), 'w') as f:
+                f.write('hello')
+        os.symlink('t.txt', os.path.join(self.root, 'link.txt'))
+        os.symlink('a', os.path.join(self.root, 'a', 'up'))
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_links_are_not_counted_as_files(self):
+        import json
+        html: str = os.path.join(self._tmp.name, 'report.html')
+        p = _run(self.root, 'print', '-r', '-o', html)
+        self.assertEqual(p.returncode, 0, p.stdout)
+        with open(html) as f:
+            line: str = [l for l in f if l.startswith('const meta = ')][0]
+        root: list = json.loads(line[len('const meta = '):].rstrip().rstrip(';'))['roots'][0]
+        self.assertEqual(root[3:5], [2, 1])
+
+class TestDiff(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root: str = os.path.join(self._tmp.name, 'tree')
+        os.makedirs(os.path.join(self.root, 'a', 'b'))
+        for name in ['t.txt', os.path.join('a', 'x.txt'), os.path.join('a', 'b', 'y.txt')]:
+            with open(os.path.join(self.root, name), 'w') as f:
+                f.write('hello')
+        self.snapshot: str = os.path.join(self._tmp.name, 'tree.snap')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_directory_is_walked_like_the_snapshot(self):
+        p = _run(self.root, 'print', '-r', '--save-snapshot', self.snapshot)
+        self.assertEqual(p.returncode, 0, p.stdout)
+        with open(os.path.join(self.root, 'a', 'b', 'y.txt'), 'a') as f:
+            f.write('!!!')
+        p = _run(self.snapshot, self.root, 'diff')
+        self.assertEqual(p.returncode, 0, p.stdout)
+        self.assertIn('0 added, 0 removed, 1 resized, 0 modified; size change +3 bytes', p.stdout)
+
+    def test_conflicting_walk_options_are_refused(self):
+        _run(self.root, 'print', '--save-snapshot', self.snapshot)
+        p = _run(self.snapshot, self.root, 'diff', '-r')
+        self.assertNotEqual(p.returncode, 0, p.stdout)
+        self.assertIn('recursive', p.stdout)
+
+    def test_commands_without_a_walk_write_metrics(self):
+        import json
+        p = _run(self.root, 'print', '-r', '--save-snapshot', self.snapshot)
+        self.assertEqual(p.returncode, 0, p.stdout)
+        metrics_file: str = os.path.join(self._tmp.name, 'metrics.json')
+        for args in [(self.root, 'estimate', '-r', '--entry-budget', '100'), (self.snapshot, 'render'), (self.snapshot, self.root, 'diff')]:
+            with self.subTest(command=args[-1] if args[-1] in ['render', 'diff'] else 'estimate'):
+                p = _run(*args, '--metrics-file', metrics_file)
+                self.assertEqual(p.returncode, 0, p.stdout)
+                with open(metrics_file) as f:
+                    metrics: dict = json.load(f)
+                os.remove(metrics_file)
+                self.assertTrue(metrics['success'])
+                self.assertEqual(metrics['file_count'], 3)
+                self.assertEqual(metrics['roots'][-1]['bytes'], 15)
+
+# A worker that dies (exit code 3) after listing a few directories of its first shard
+_DYING_WORKER: str = """
+import os, runpy, sys
+listdir = os.listdir
+listed = [0]
+def dying_listdir(path):
+    listed[0] += 1
+    if listed[0] > 3:
+        os._exit(3)
+    return listdir(path)
+os.listdir = dying_listdir
+sys.argv = sys.argv[1:]
+runpy.run_path(sys.argv[0], run_name='__main__')
+"""
+
+# A walk that is stopped with SIGTERM after listing a few directories
+_TERMINATED_WALK: str = """
+import os, runpy, signal, sys
+listed = [0]
+def terminating(list_fn):
+    def listing(path):
+        listed[0] += 1
+        if listed[0] == 6:
+            os.kill(os.getpid(), signal.SIGTERM)
+        return list_fn(path)
+    return listing
+os.listdir = terminating(os.listdir)
+os.scandir = terminating(os.scandir)
+os.supports_fd.add(os.scandir)
+sys.argv = sys.argv[1:]
+runpy.run_path(sys.argv[0], run_name='__main__')
+"""
+
+class TestResume(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root: str = os.path.join(self._tmp.name, 'tree')
+        for i in range(3):
+            for j in range(4):
+                folder: str = os.path.join(self.root, f'd{i}', f'e{j}')
+                os.makedirs(folder)
+                for k in range(2):
+                    with open(os.path.join(folder, f'f{k}.txt'), 'w') as f:
+                        f.write('x' * (i + j + k))
+        self.journal: str = os.path.join(self._tmp.name, 'walk.journal')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _read(self, csv: str) -> str:
+        with open(csv) as f:
+            return f.read()
+
+    def test_resumed_walk_equals_a_fresh_walk(self):
+        for mode in [(), ('--fd-walk',), ('--traversal', 'bfs'), ('--traversal', 'bfs', '--fd-walk')]:
+            with self.subTest(mode=mode):
+                fresh: str = os.path.join(self._tmp.name, 'fresh.csv')
+                resumed: str = os.path.join(self._tmp.name, 'resumed.csv')
+                p = _run(self.root, 'print', '-r', *mode, '-o', fresh)
+                self.assertEqual(p.returncode, 0, p.stdout)
+                stopped = subprocess.run([sys.executable, '-c', _TERMINATED_WALK, WALKDIR, self.root, 'print', '-r', *mode, '--checkpoint', self.journal, '-o', resumed], capture_output=True, text=True, errors='surrogateescape', timeout=120)
+                self.assertEqual(stopped.returncode, 128 + 15, stopped.stdout)
+                self.assertIn('run again with --resume', stopped.stdout)
+                p = _run(self.root, 'print', '-r', *mode, '--checkpoint', self.journal, '--resume', '-o', resumed)
+                self.assertEqual(p.returncode, 0, p.stdout)
+                self.assertRegex(p.stdout, r'Resuming from .*: [1-9]\d* directories already walked')
+                self.assertEqual(self._read(resumed), self._read(fresh))
+                self.assertFalse(os.path.exists(self.journal))
+
+class TestDistributedWalk(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root: str = os.path.join(self._tmp.name, 'tree')
+        for i in range(4):
+            for j in range(6):
+                folder: str = os.path.join(self.root, f'd{i}', f'e{j}')
+                os.makedirs(folder)
+                for k in range(3):
+                    with open(os.path.join(folder, f'f{k}.txt'), 'w') as f:
+                        f.write('x' * (i + j + k))
+        with open(os.path.join(self.root, 'top.txt'), 'w') as f:
+            f.write('top')
+        self.address: str = 'unix:' + os.path.join(self._tmp.name, 'coordinator.sock')
+        self.env: dict = {k: v for k, v in os.environ.items() if k != 'WALKDIR_TOKEN'}
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _local_csv(self) -> str:
+        csv: str = os.path.join(self._tmp.name, 'local.csv')
+        p = _run(self.root, 'print', '-r', '-o', csv)
+        self.assertEqual(p.returncode, 0, p.stdout)
+        with open(csv) as f:
+            return f.read()
+
+    def _read(self, csv: str) -> str:
+        with open(csv) as f:
+            return f.read()
+
+    def test_local_workers_give_the_same_csv(self):
+        csv: str = os.path.join(self._tmp.name, 'workers.csv')
+        p = _run(self.root, 'print', '-r', '--workers', '2', '-o', csv)
+        self.assertEqual(p.returncode, 0, p.stdout)
+        self.assertIn('Shards walked: 4/4', p.stdout)
+        self.assertEqual(self._read(csv), self._local_csv())
+
+    def test_shard_of_a_killed_worker_is_handed_out_again(self):
+        csv: str = os.path.join(self._tmp.name, 'workers.csv')
+        coordinator = subprocess.Popen([sys.executable, WALKDIR, self.root, 'print', '-r', '--coordinator', self.address, '--worker-timeout', '30', '-o', csv], stdout=subprocess.PIPE, text=True, errors='surrogateescape', env=self.env)
+        try:
+            dying = subprocess.run([sys.executable, '-c', _DYING_WORKER, WALKDIR, self.root, 'worker', '--connect', self.address], capture_output=True, timeout=60, env=self.env)
+            self.assertEqual(dying.returncode, 3)
+            worker = subprocess.run([sys.executable, WALKDIR, self.root, 'worker', '--connect', self.address], capture_output=True, text=True, timeout=60, env=self.env)
+            self.assertEqual(worker.returncode, 0, worker.stdout)
+            out, _ = coordinator.communicate(timeout=60)
+        finally:
+            coordinator.kill()
+            coordinator.wait()
+        self.assertEqual(coordinator.returncode, 0, out)
+        self.assertIn('is handed out again', out)
+        self.assertEqual(self._read(csv), self._local_csv())
+
+    def test_shards_are_walked_locally_without_workers(self):
+        csv: str = os.path.join(self._tmp.name, 'fallback.csv')
+        p = subprocess.run([sys.executable, WALKDIR, self.root, 'print', '-r', '--coordinator', self.address, '--worker-timeout', '0.5', '-o', csv], capture_output=True, text=True, timeout=120, env=self.env)
+        self.assertEqual(p.returncode, 0, p.stdout)
+        self.assertIn('No worker is connected, walking shard', p.stdout)
+        self.assertEqual(self._read(csv), self._local_csv())
+
+    def test_worker_with_a_wrong_token_is_rejected(self):
+        coordinator = subprocess.Popen([sys.executable, WALKDIR, self.root, 'print', '-r', '--coordinator', self.address, '--worker-timeout', '2'], stdout=subprocess.PIPE, text=True, errors='surrogateescape', env=dict(self.env, WALKDIR_TOKEN='right'))
+        try:
+            worker = subprocess.run([sys.executable, WALKDIR, self.root, 'worker', '--connect', self.address], capture_output=True, text=True, timeout=60, env=dict(self.env, WALKDIR_TOKEN='wrong'))
+            out, _ = coordinator.communicate(timeout=60)
+        finally:
+            coordinator.kill()
+            coordinator.wait()
+        self.assertNotEqual(worker.returncode, 0, worker.stdout)
+        self.assertIn('Rejected by the coordinator', worker.stdout)
+        self.assertEqual(coordinator.returncode, 0, out)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,28 @@
+from __future__ import annotations
 import sys
 import os
 import re
+import copy
+import errno
+import io
+import threading
+import math
+import time
+import stat
 import optparse
-import concurrent.futures
-import subprocess
-import shutil
-import xlsxwriter
+# Everything else (xlsxwriter above all) is imported by the code that needs it,
+# so that a console-only run does not pay for exporters it never uses.
+# Budget: `python -X importtime -c "import walkdir"` stays under 30 ms cumulative
+TYPE_CHECKING: bool = False
+if TYPE_CHECKING:
+    import random
+    import sqlite3
+    import subprocess
+    import xlsxwriter
+try:
+    import pwd
+except ImportError:
+    pwd = None
 from enum import Enum, IntEnum
 
 S_Root: str = 'Root'
@@ -15,6 +32,10 @@ S_Fullpath: str = 'Fullpath'
 S_Type: str = 'Type'
 S_Size: str = 'Size'
 S_Extension: str = 'Extension'
+S_Mtime: str = 'Modified'
+S_Mode: str = 'Mode'
+S_Owner: str = 'Owner'
+S_Inode: str = 'Inode'
 S_Command: str = 'Command'
 S_Result: str = 'Result'
 S_Remark: str = 'Remark'
@@ -23,6 +44,16 @@ S_Failed: str = 'Failed'
 S_Empty: str = ''
 S_Sharp: str = '#'
 
+_O_DIRFLAGS: int = os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0) | getattr(os, 'O_NOFOLLOW', 0)
+
+def _open_workbook(file: str, constant_memory: bool = False) -> xlsxwriter.Workbook:
+    """
+    With `constant_memory`, rows are flushed to disk as soon as a later row is
+    written, so cells must be written in row order.
+    """
+    import xlsxwriter
+    return xlsxwriter.Workbook(file, {'constant_memory': constant_memory})
+
 class XlsBorderStyle(IntEnum):
     NONE = 0,
     CONTINUOUS = 1
@@ -375,6 +406,15 @@ class IOItem:
         self._result: bool = False
         self._tag = None
         self._status: bool = False
+        self._store = None
+        self._store_id: int = 0
+        self._mtime: float = 0
+        self._mode: int = 0
+        self._uid: int = 0
+        self._inode: int = 0
+        self._fingerprint: int = None
+        self._remark: str = None
+        self._full_path: str = None
         
     @property
     def name(self) -> str:
@@ -382,13 +422,17 @@ class IOItem:
     @name.setter
     def name(self, val: str):
         self._name = val
+        self._full_path = None
 
     @property
     def path(self) -> str:
+        if self._path is None and self._parent is not None:
+            return self._parent.full_path
         return self._path
     @path.setter
     def path(self, val: str):
         self._path = val
+        self._full_path = None
 
     @property
     def status(self) -> bool:
@@ -397,9 +441,27 @@ class IOItem:
     def status(self, val: bool):
         self._status = val
 
+    @property
+    def remark(self) -> str:
+        return self._remark
+    @remark.setter
+    def remark(self, val: str):
+        self._remark = val
+
+    @property
+    def failed(self) -> bool:
+        """An item with a remark could not be walked (or stat'ed) completely"""
+        return self._remark is not None
+
     @property
     def full_path(self) -> str:
-        return os.path.join(self._path, self._name)
+        if self._full_path is not None:
+            return self._full_path
+        full_path: str = os.path.join(self.path, self._name)
+        if self._kind == IOKind.DIR:
+            # Kept for the children, which would otherwise join the whole chain again each
+            self._full_path = full_path
+        return full_path
     
     @property
     def kind(self) -> IOKind:
@@ -408,17 +470,11 @@ class IOItem:
     @property
     def extension(self) -> str:
         if self._kind == IOKind.FILE:
-            if len(self._name) > 0:
-                ext: str = ''
-                try:
-                    a,b = os.path.splitext(self._name)
-                    pos: int = 0
-                    while b[pos] == '.' and pos < len(b):
-                        pos += 1
-                    ext = b[pos:]
-                except:
-                    ext = ''
-                return ext
+            # Same as os.path.splitext(): the last suffix, unless only dots precede it
+            name: str = self._name
+            dot: int = name.rfind('.')
+            if dot > 0 and (name[0] != '.' or len(name[:dot].lstrip('.')) > 0):
+                return name[dot + 1:]
         return ''
         
     @property
@@ -428,9 +484,12 @@ class IOItem:
     @parent.setter
     def parent(self, val):
         self._parent = val
+        self._full_path = None
         
     @property
     def children(self) -> list:
+        if self._store is not None:
+            return self._store.load(self)
         if self._childs is None:
             self._childs = []
         return self._childs
@@ -449,6 +508,60 @@ class IOItem:
     def depth(self, val: int):
         self._depth = val
     
+    @property
+    def mtime(self) -> float:
+        return self._mtime
+    @mtime.setter
+    def mtime(self, val: float):
+        self._mtime = val
+
+    @property
+    def mode(self) -> int:
+        return self._mode
+    @mode.setter
+    def mode(self, val: int):
+        self._mode = val
+
+    @property
+    def uid(self) -> int:
+        return self._uid
+    @uid.setter
+    def uid(self, val: int):
+        self._uid = val
+
+    @property
+    def inode(self) -> int:
+        return self._inode
+    @inode.setter
+    def inode(self, val: int):
+        self._inode = val
+
+    def set_stat(self, st: os.stat_result):
+        self._mtime = st.st_mtime
+        self._mode = st.st_mode
+        self._uid = st.st_uid
+        self._inode = st.st_ino
+
+    @property
+    def fingerprint(self) -> int:
+        """
+        64-bit hash of the item: kind, name, size and mtime for files and links,
+        rolled up from the children for folders (so two folders with the same
+        fingerprint hold the same subtree).
+        """
+        if self._fingerprint is None:
+            import hashlib
+            h = hashlib.blake2b(digest_size=8)
+            if self._kind == IOKind.DIR:
+                h.update(self._size.to_bytes(8, 'little'))
+                for child in self.children:
+                    h.update(child.name.encode('utf-8', 'surrogateescape'))
+                    h.update(child.fingerprint.to_bytes(8, 'little'))
+            else:
+                h.update(f'{int(self._kind)}/{self._name}/{self._size}/{round(self._mtime * 1e6)}'.encode('utf-8', 'surrogateescape'))
+            self._fingerprint = int.from_bytes(h.digest(), 'little')
+        return self._fingerprint
+
     @property
     def tag(self):
         return self._tag
@@ -461,11 +574,13 @@ class IOItem:
         
 
 class IOFile(IOItem):
-    def __init__(self, name: str, path: str, depth: int = 0, parent = None) -> None:
+    def __init__(self, name: str, path: str, depth: int = 0, parent = None, size: int = None) -> None:
         super().__init__(IOKind.FILE, name, path, depth, parent)
-        if os.path.exists(self._path):
-            stat = os.stat(self._path)
-            self._size = stat.st_size
+        if size is not None:
+            self._size = size
+        elif os.path.exists(self.full_path):
+            st = os.stat(self.full_path)
+            self._size = st.st_size
 
 class IOFolder(IOItem):
     def __init__(self, name: str, path: str, depth: int = 0, parent = None) -> None:
@@ -475,9 +590,1420 @@ class IOLink(IOItem):
     def __init__(self, name: str, path: str, depth: int = 0, parent = None) -> None:
         super().__init__(IOKind.LINK, name, path, depth, parent)
 
+class IOField:
+    """
+    A report column: `value` gets the cell value of an item, `text` its console text.
+    """
+    def __init__(self, name: str, value, text = None) -> None:
+        self._name: str = name
+        self._value = value
+        self._text = text
+        if self._text is None:
+            self._text = lambda item: str(value(item))
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def value(self):
+        return self._value
+
+    @property
+    def text(self):
+        return self._text
+
+_owners: dict = {}
+
+def _owner_name(uid: int) -> str:
+    name: str = _owners.get(uid)
+    if name is None:
+        name = str(uid)
+        if pwd is not None:
+            try:
+                name = pwd.getpwuid(uid).pw_name
+            except KeyError:
+                pass
+        _owners[uid] = name
+    return name
+
+def _get_result(item: IOItem) -> str:
+    if item.tag is None:
+        return S_Empty
+    return S_Success if item.status else S_Failed
+
+_get_name = lambda item: item.name
+_get_path = lambda item: item.path
+_get_full_path = lambda item: item.full_path
+_get_kind = lambda item: item.kind.name
+_get_extension = lambda item: item.extension
+_get_mtime = lambda item: time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(item.mtime))
+_get_mode = lambda item: stat.filemode(item.mode)
+_get_owner = lambda item: _owner_name(item.uid)
+_get_command = lambda item: item.tag.name if item.tag is not None else S_Empty
+_get_remark = lambda item: item.remark if item.remark is not None else S_Empty
+
+# Text fields use their value as console text, saving a str() call per cell
+FIELDS: dict = {
+    S_Name: IOField(S_Name, _get_name, _get_name),
+    S_Path: IOField(S_Path, _get_path, _get_path),
+    S_Fullpath: IOField(S_Fullpath, _get_full_path, _get_full_path),
+    S_Type: IOField(S_Type, _get_kind, _get_kind),
+    S_Size: IOField(S_Size, lambda item: item.size, lambda item: str(item.size)),
+    S_Extension: IOField(S_Extension, _get_extension, _get_extension),
+    S_Mtime: IOField(S_Mtime, _get_mtime, _get_mtime),
+    S_Mode: IOField(S_Mode, _get_mode, _get_mode),
+    S_Owner: IOField(S_Owner, _get_owner, _get_owner),
+    S_Inode: IOField(S_Inode, lambda item: item.inode, lambda item: str(item.inode)),
+    S_Command: IOField(S_Command, _get_command, _get_command),
+    S_Result: IOField(S_Result, _get_result, _get_result),
+    S_Remark: IOField(S_Remark, _get_remark, _get_remark),
+}
+
+class IOSpillStore:
+    """
+    On-disk (SQLite) storage for completed subtrees.
+    A spilled folder keeps no children in memory; reading its `children` loads
+    them back from the store in walk order, one directory at a time.
+    Names and remarks are stored as UTF-8 bytes with surrogateescape, as in
+    snapshots, so that names that are not valid UTF-8 round-trip.
+    """
+    def __init__(self, tag = None, dir: str = None) -> None:
+        import sqlite3
+        import tempfile
+        fd, self._file = tempfile.mkstemp(prefix='walkdir-', suffix='.sqlite', dir=dir)
+        os.close(fd)
+        self._tag = tag
+        self._next_id: int = 0
+        self._db: sqlite3.Connection = sqlite3.connect(self._file, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=OFF')
+        self._db.execute('PRAGMA synchronous=OFF')
+        self._db.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, parent INTEGER, seq INTEGER, kind INTEGER, name BLOB, size INTEGER, depth INTEGER, mtime REAL, mode INTEGER, uid INTEGER, inode INTEGER, remark BLOB)')
+        self._db.execute('CREATE INDEX items_parent ON items (parent, seq)')
+
+    @property
+    def file(self) -> str:
+        return self._file
+
+    def _new_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    @staticmethod
+    def _row(item_id: int, parent_id: int, seq: int, child: IOItem) -> tuple:
+        remark: bytes = child.remark.encode('utf-8', 'surrogateescape') if child.remark is not None else None
+        return (item_id, parent_id, seq, int(child.kind), child.name.encode('utf-8', 'surrogateescape'), child.size, child.depth, child.mtime, child.mode, child.uid, child.inode, remark)
+
+    def spill(self, folder: IOItem) -> int:
+        """
+        Move all in-memory descendants of `folder` to the store.
+        Returns the number of items released from memory.
+        """
+        if folder._store is not None:
+            return 0
+        rows: list = []
+        count: int = 0
+        stack: list = [(folder, self._new_id())]
+        folder_id: int = stack[0][1]
+        while len(stack) > 0:
+            item, item_id = stack.pop()
+            for seq, child in enumerate(item.children):
+                if child._store is self:
+                    rows.append(IOSpillStore._row(child._store_id, item_id, seq, child))
+                    continue
+                child_id: int = self._new_id()
+                rows.append(IOSpillStore._row(child_id, item_id, seq, child))
+                count += 1
+                if child.kind == IOKind.DIR:
+                    stack.append((child, child_id))
+        self._db.executemany('INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        self._db.commit()
+        folder._childs = None
+        folder._store = self
+        folder._store_id = folder_id
+        return count
+
+    def load(self, folder: IOItem) -> list:
+        children: list = []
+        for item_id, kind, name, size, depth, mtime, mode, uid, inode, remark in self._db.execute('SELECT id, kind, name, size, depth, mtime, mode, uid, inode, remark FROM items WHERE parent = ? ORDER BY seq', (folder._store_id,)):
+            child: IOItem = None
+            name = name.decode('utf-8', 'surrogateescape')
+            if kind == IOKind.DIR:
+                child = IOFolder(name, None, depth, folder)
+                child._store = self
+                child._store_id = item_id
+            elif kind == IOKind.LINK:
+                child = IOLink(name, None, depth, folder)
+            else:
+                child = IOFile(name, None, depth, folder, size)
+            child.size = size
+            child.mtime = mtime
+            child.mode = mode
+            child.uid = uid
+            child.inode = inode
+            child.remark = remark.decode('utf-8', 'surrogateescape') if remark is not None else None
+            child.tag = self._tag
+            children.append(child)
+        return children
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        if os.path.exists(self._file):
+            os.remove(self._file)
+
+class IOJournal:
+    """
+    Append-only checkpoint journal of a walk.
+    Every listed directory is recorded (as one JSON line) before its children are
+    walked, so on resume the recorded directories are rebuilt without touching the
+    file system and only the pending ones are listed again. Resuming only indexes
+    where each record starts; a record is read back when its directory is reached.
+    """
+    VERSION: int = 1
+
+    def __init__(self, file: str, header: dict, resume: bool = False, interval: float = 30) -> None:
+        import json
+        self._file: str = file
+        self._interval: float = interval
+        self._entries: dict = {}
+        self._reader: int = None
+        self._pending: list = []
+        self._lock: threading.Lock = threading.Lock()
+        self._last_flush: float = time.monotonic()
+        header = dict(header, version=IOJournal.VERSION)
+        if resume and os.path.exists(file):
+            with open(file, 'rb') as f:
+                first: bytes = f.readline()
+                if len(first) == 0 or json.loads(first) != header:
+                    raise ValueError(f'{file} was written by a walk with other directories or options')
+                offset: int = len(first)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break # Interrupted while writing the last record
+                    # Records start with {"d": <path>, so the path is decoded without parsing the entries
+                    end: int = line.index(b', "e": ')
+                    self._entries[json.loads(line[6:end])] = (offset, len(line))
+                    offset += len(line)
+            self._reader = os.open(file, os.O_RDONLY)
+            self._fp = open(file, 'a', encoding='utf-8')
+        else:
+            self._fp = open(file, 'w', encoding='utf-8')
+            self._fp.write(json.dumps(header) + '\n')
+            self.flush()
+
+    @property
+    def file(self) -> str:
+        return self._file
+
+    @property
+    def replayable(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, path: str) -> list:
+        import json
+        pos: tuple = self._entries.pop(path, None)
+        if pos is None:
+            return None
+        rec: dict = json.loads(os.pread(self._reader, pos[1], pos[0]))
+        return [(name, IOKind(kind), IOJournal._entry_stat(st)) for name, kind, st in rec['e']]
+
+    @staticmethod
+    def _entry_stat(st):
+        if st is None:
+            return None
+        if isinstance(st, dict):
+            return OSError(st['errno'], st['strerror'], st['filename'])
+        return os.stat_result(st)
+
+    def record(self, path: str, entries: list):
+        import json
+        rec: list = []
+        for name, kind, st in entries:
+            if st is None:
+                rec.append((name, int(kind), None))
+            elif isinstance(st, OSError):
+                rec.append((name, int(kind), {'errno': st.errno, 'strerror': st.strerror, 'filename': st.filename}))
+            else:
+                rec.append((name, int(kind), list(st[:10]) + [st.st_atime, st.st_mtime, st.st_ctime]))
+        self._pending.append(json.dumps({'d': path, 'e': rec}) + '\n')
+        if time.monotonic() - self._last_flush >= self._interval:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending: list = self._pending
+            self._pending = []
+            if self._fp is None:
+                return
+            self._fp.writelines(pending)
+            self._fp.flush()
+            os.fsync(self._fp.fileno())
+            self._last_flush = time.monotonic()
+
+    def close(self, completed: bool = False):
+        self.flush()
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+        if self._reader is not None:
+            os.close(self._reader)
+            self._reader = None
+        if completed and os.path.exists(self._file):
+            os.remove(self._file)
+
+class IOSnapshot:
+    """
+    Compact binary snapshot of walked trees.
+    Layout: magic, version, command name, counters, the walk options (JSON, so
+    that a directory can be walked again the same way), then per root its path
+    and its items in pre-order. Every item is (kind, name, size, depth, mtime, mode,
+    uid, inode, remark), and
+    folders add their fingerprint and child count; integers are varints and names
+    are interned: a name is written once, later occurrences refer to it by index. The stream is gzip/xz compressed when the
+    file name ends with .gz/.xz, and read through mmap when it is not.
+    """
+    MAGIC: bytes = b'WDSNAP'
+    VERSION: int = 5
+
+    def __init__(self, file: str) -> None:
+        self._file: str = file
+        self._options: dict = None
+
+    @property
+    def file(self) -> str:
+        return self._file
+
+    @property
+    def options(self) -> dict:
+        """The walk options of the loaded snapshot, None if it does not have them"""
+        return self._options
+
+    def _open(self, mode: str):
+        import gzip
+        import lzma
+        if self._file.endswith('.gz'):
+            return gzip.open(self._file, mode)
+        if self._file.endswith('.xz'):
+            return lzma.open(self._file, mode)
+        return open(self._file, mode)
+
+    @staticmethod
+    def _put_varint(buf: bytearray, val: int):
+        while val >= 0x80:
+            buf.append((val & 0x7F) | 0x80)
+            val >>= 7
+        buf.append(val)
+
+    @staticmethod
+    def _put_str(buf: bytearray, val: str):
+        data: bytes = val.encode('utf-8', 'surrogateescape')
+        IOSnapshot._put_varint(buf, len(data))
+        buf += data
+
+    def save(self, roots: list, name: str = '', counters: tuple = (0, 0, 0), options: dict = None):
+        with self._open('wb') as f:
+            self.write(f, roots, name, counters, options)
+
+    def dumps(self, roots: list, name: str = '', counters: tuple = (0, 0, 0), options: dict = None) -> bytes:
+        f: io.BytesIO = io.BytesIO()
+        self.write(f, roots, name, counters, options)
+        return f.getvalue()
+
+    def write(self, f, roots: list, name: str = '', counters: tuple = (0, 0, 0), options: dict = None):
+        names: dict = {}
+        buf: bytearray = bytearray(IOSnapshot.MAGIC)
+        buf.append(IOSnapshot.VERSION)
+        IOSnapshot._put_str(buf, name)
+        for c in counters:
+            IOSnapshot._put_varint(buf, c)
+        if options is None:
+            IOSnapshot._put_str(buf, S_Empty)
+        else:
+            import json
+            IOSnapshot._put_str(buf, json.dumps(options))
+        IOSnapshot._put_varint(buf, len(roots))
+        for root in roots:
+            IOSnapshot._put_str(buf, root.path)
+            stack: list = [root]
+            while len(stack) > 0:
+                item: IOItem = stack.pop()
+                buf.append(int(item.kind))
+                index: int = names.get(item.name)
+                if index is None:
+                    names[item.name] = len(names) + 1
+                    IOSnapshot._put_varint(buf, 0)
+                    IOSnapshot._put_str(buf, item.name)
+                else:
+                    IOSnapshot._put_varint(buf, index)
+                IOSnapshot._put_varint(buf, item.size)
+                IOSnapshot._put_varint(buf, item.depth)
+                usec: int = round(item.mtime * 1e6)
+                IOSnapshot._put_varint(buf, (usec << 1) ^ (usec >> 63))
+                IOSnapshot._put_varint(buf, item.mode)
+                IOSnapshot._put_varint(buf, item.uid)
+                IOSnapshot._put_varint(buf, item.inode)
+                IOSnapshot._put_str(buf, item.remark if item.remark is not None else S_Empty)
+                if item.kind == IOKind.DIR:
+                    buf += item.fingerprint.to_bytes(8, 'little')
+                    children: list = item.children
+                    IOSnapshot._put_varint(buf, len(children))
+                    stack.extend(reversed(children))
+                if len(buf) >= 1 << 20:
+                    f.write(buf)
+                    buf = bytearray()
+        f.write(buf)
+
+    def load(self, tag = None) -> tuple:
+        """
+        Returns (roots, name, counters) of the snapshot.
+        """
+        import mmap
+        with open(self._file, 'rb') as f:
+            if self._file.endswith('.gz') or self._file.endswith('.xz'):
+                with self._open('rb') as z:
+                    data = z.read()
+                return self._parse(data, tag)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return self._parse(data, tag)
+
+    def loads(self, data: bytes, tag = None) -> tuple:
+        """
+        Returns (roots, name, counters) of a snapshot made by dumps().
+        """
+        return self._parse(data, tag)
+
+    def _parse(self, data, tag) -> tuple:
+        if data[:len(IOSnapshot.MAGIC)] != IOSnapshot.MAGIC:
+            raise ValueError(f'{self._file} is not a snapshot file')
+        pos: int = len(IOSnapshot.MAGIC)
+        version: int = data[pos]
+        if version < 1 or version > IOSnapshot.VERSION:
+            raise ValueError(f'{self._file}: unsupported snapshot version {version}')
+        pos += 1
+
+        def varint() -> int:
+            nonlocal pos
+            val: int = 0
+            shift: int = 0
+            while True:
+                b: int = data[pos]
+                pos += 1
+                val |= (b & 0x7F) << shift
+                if b < 0x80:
+                    return val
+                shift += 7
+
+        def string() -> str:
+            nonlocal pos
+            n: int = varint()
+            val: str = data[pos:pos + n].decode('utf-8', 'surrogateescape')
+            pos += n
+            return val
+
+        name: str = string()
+        counters: tuple = (varint(), varint(), varint())
+        self._options = None
+        if version >= 5:
+            options: str = string()
+            if len(options) > 0:
+                import json
+                self._options = json.loads(options)
+        names: list = []
+        roots: list = []
+        for r in range(varint()):
+            path: str = string()
+            root: IOItem = None
+            stack: list = [] # [folder, remaining children]
+            while True:
+                kind: IOKind = IOKind(data[pos])
+                pos += 1
+                index: int = varint()
+                if index == 0:
+                    names.append(string())
+                    index = len(names)
+                size: int = varint()
+                depth: int = varint()
+                mtime: float = 0
+                mode: int = 0
+                uid: int = 0
+                inode: int = 0
+                remark: str = None
+                fingerprint: int = None
+                if version >= 2:
+                    usec: int = varint()
+                    mtime = ((usec >> 1) ^ -(usec & 1)) / 1e6
+                    if version >= 3:
+                        mode = varint()
+                        uid = varint()
+                        inode = varint()
+                    if version >= 4:
+                        remark = string() or None
+                    if kind == IOKind.DIR:
+                        fingerprint = int.from_bytes(data[pos:pos + 8], 'little')
+                        pos += 8
+                parent: IOItem = stack[-1][0] if len(stack) > 0 else None
+                item: IOItem = None
+                if kind == IOKind.DIR:
+                    item = IOFolder(names[index - 1], path if parent is None else None, depth, parent)
+                elif kind == IOKind.LINK:
+                    item = IOLink(names[index - 1], None, depth, parent)
+                else:
+                    item = IOFile(names[index - 1], None, depth, parent, size)
+                item.size = size
+                item.mtime = mtime
+                item.mode = mode
+                item.uid = uid
+                item.inode = inode
+                item.remark = remark
+                item._fingerprint = fingerprint
+                item.tag = tag
+                if parent is None:
+                    root = item
+                else:
+                    parent.children.append(item)
+                    stack[-1][1] -= 1
+                if kind == IOKind.DIR:
+                    stack.append([item, varint()])
+                while len(stack) > 0 and stack[-1][1] == 0:
+                    stack.pop()
+                if len(stack) == 0:
+                    break
+            roots.append(root)
+        return roots, name, counters
+
+class IOStreamExporter:
+    """
+    Writes one row per item to a CSV or NDJSON stream as soon as the item is
+    complete, through a large write buffer. Files whose name ends with .gz are
+    gzip compressed, .zst needs the zstandard package.
+    """
+    BUFFER_SIZE: int = 1 << 20
+
+    def __init__(self, file: str, fields: list) -> None:
+        self._file: str = file
+        if len(fields) == 0:
+            fields = tuple(FIELDS.values())
+        self._fields: list = [f.name for f in fields]
+        self._getters: tuple = tuple([f.value for f in fields])
+        self._lock: threading.Lock = threading.Lock()
+        self._count: int = 0
+        self._fp = None
+
+    def _open_text(self, file: str):
+        import gzip
+        raw = None
+        if file.endswith('.gz'):
+            raw = gzip.open(file, 'wb', compresslevel=6)
+        elif file.endswith('.zst'):
+            try:
+                import zstandard
+            except ImportError:
+                raise ValueError(f'{file}: writing .zst files needs the zstandard package')
+            raw = zstandard.ZstdCompressor().stream_writer(open(file, 'wb'))
+        else:
+            raw = open(file, 'wb')
+        return io.TextIOWrapper(io.BufferedWriter(raw, IOStreamExporter.BUFFER_SIZE), encoding='utf-8', errors='surrogateescape', newline='')
+
+    @staticmethod
+    def format(file: str) -> str:
+        """
+        Returns 'csv', 'jsonl', 'sqlite' or 'html' when `file` names a streaming output, None otherwise.
+        """
+        if not isinstance(file, str):
+            return None
+        name: str = file.lower()
+        if name.endswith('.sqlite') or name.endswith('.sqlite3') or name.endswith('.db'):
+            return 'sqlite'
+        if name.endswith('.html') or name.endswith('.htm'):
+            return 'html'
+        for ext in ['.gz', '.zst']:
+            if name.endswith(ext):
+                name = name[:-len(ext)]
+        if name.endswith('.csv'):
+            return 'csv'
+        if name.endswith('.jsonl') or name.endswith('.ndjson'):
+            return 'jsonl'
+        return None
+
+    @staticmethod
+    def create(file: str, fields: list):
+        fmt: str = IOStreamExporter.format(file)
+        if fmt == 'csv':
+            return IOCsvExporter(file, fields)
+        if fmt == 'jsonl':
+            return IOJsonExporter(file, fields)
+        if fmt == 'sqlite':
+            return IOSqliteExporter(file, fields)
+        if fmt == 'html':
+            return IOHtmlExporter(file, fields)
+        return None
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def write(self, item: IOItem):
+        item.status = not item.failed
+        row: list = [get(item) for get in self._getters]
+        with self._lock:
+            self._write(row)
+            self._count += 1
+
+    def _write(self, row: list):
+        pass
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+class IOCsvExporter(IOStreamExporter):
+    def __init__(self, file: str, fields: list) -> None:
+        import csv
+        super().__init__(file, fields)
+        self._fp = self._open_text(file)
+        self._csv = csv.writer(self._fp)
+        self._csv.writerow(self._fields)
+
+    def _write(self, row: list):
+        self._csv.writerow(row)
+
+class IOJsonExporter(IOStreamExporter):
+    def __init__(self, file: str, fields: list) -> None:
+        import json
+        super().__init__(file, fields)
+        self._fp = self._open_text(file)
+        self._encoder: json.JSONEncoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+    def _write(self, row: list):
+        self._fp.write(self._encoder.encode(dict(zip(self._fields, row))))
+        self._fp.write('\n')
+
+class IOSqliteExporter(IOStreamExporter):
+    """
+    Loads items into an `items` table that references the parent folder by id
+    instead of repeating paths, in large executemany() transactions. Indexes on
+    extension, size and parent are built once everything is loaded.
+    Folders arrive after their children, so a folder's id is reserved when its
+    first child is written.
+    Names that are not valid UTF-8 are stored with the bad bytes escaped (as
+    \\xff) and their exact bytes are kept in `raw_name` (`raw_path` for roots),
+    which is NULL otherwise.
+    """
+    BATCH_SIZE: int = 50000
+
+    def __init__(self, file: str, fields: list) -> None:
+        import sqlite3
+        super().__init__(file, fields)
+        if os.path.exists(file):
+            os.remove(file)
+        self._db: sqlite3.Connection = sqlite3.connect(file, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=OFF')
+        self._db.execute('PRAGMA synchronous=OFF')
+        self._db.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, parent INTEGER REFERENCES items (id), name TEXT, type TEXT, size INTEGER, extension TEXT, mtime REAL, depth INTEGER, raw_name BLOB)')
+        self._db.execute('CREATE TABLE roots (id INTEGER PRIMARY KEY REFERENCES items (id), path TEXT, raw_path BLOB)')
+        self._db.execute('''CREATE VIEW paths (id, path, raw_path) AS
+            WITH RECURSIVE p (id, path, raw_path) AS (
+                SELECT roots.id, roots.path, COALESCE(roots.raw_path, CAST(roots.path AS BLOB)) FROM roots
+                UNION ALL
+                SELECT items.id, p.path || '/' || items.name, CAST(p.raw_path || X'2F' || COALESCE(items.raw_name, CAST(items.name AS BLOB)) AS BLOB) FROM items JOIN p ON items.parent = p.id
+            ) SELECT id, path, raw_path FROM p''')
+        self._ids: dict = {}
+        self._next_id: int = 0
+        self._rows: list = []
+        self._roots: list = []
+
+    def _id(self, item: IOItem) -> int:
+        item_id: int = self._ids.get(item)
+        if item_id is None:
+            self._next_id += 1
+            item_id = self._next_id
+            self._ids[item] = item_id
+        return item_id
+
+    def write(self, item: IOItem):
+        with self._lock:
+            # The item's own row is its last use as a key: children come first
+            item_id: int = self._ids.pop(item, None)
+            if item_id is None:
+                self._next_id += 1
+                item_id = self._next_id
+            parent_id: int = None
+            if item.parent is None:
+                self._roots.append((item_id, item.full_path, None))
+            else:
+                parent_id = self._id(item.parent)
+            self._rows.append((item_id, parent_id, item.name, item.kind.name, item.size, item.extension, item.mtime, item.depth, None))
+            self._count += 1
+            if len(self._rows) >= IOSqliteExporter.BATCH_SIZE:
+                self._flush()
+
+    @staticmethod
+    def _escape(text: str) -> tuple:
+        """
+        (text, raw bytes) of a file system name: `text` with the bytes that are
+        not valid UTF-8 escaped, and the bytes only for such names.
+        """
+        try:
+            text.encode('utf-8')
+            return text, None
+        except UnicodeEncodeError:
+            raw: bytes = os.fsencode(text)
+            return raw.decode('utf-8', 'backslashreplace'), raw
+
+    def _escape_row(self, row: tuple) -> tuple:
+        name, raw = IOSqliteExporter._escape(row[2])
+        if raw is None:
+            return row
+        return row[:2] + (name, row[3], row[4], IOSqliteExporter._escape(row[5])[0]) + row[6:8] + (raw,)
+
+    def _flush(self):
+        try:
+            self._db.executemany('INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', self._rows)
+        except UnicodeEncodeError:
+            # Rare: escape the batch only when sqlite3 refused a name
+            self._db.rollback()
+            self._db.executemany('INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', [self._escape_row(row) for row in self._rows])
+        self._db.commit()
+        self._rows = []
+
+    def close(self):
+        if self._db is None:
+            return
+        self._flush()
+        self._db.executemany('INSERT INTO roots VALUES (?, ?, ?)', [(root_id,) + IOSqliteExporter._escape(path) for root_id, path, _ in self._roots])
+        self._db.execute('CREATE INDEX items_extension ON items (extension)')
+        self._db.execute('CREATE INDEX items_size ON items (size)')
+        self._db.execute('CREATE INDEX items_parent ON items (parent)')
+        self._db.execute('ANALYZE')
+        self._db.commit()
+        self._db.close()
+        self._db = None
+
+class IOHtmlExporter(IOStreamExporter):
+    """
+    Writes an HTML report made of a small index page and one script chunk per
+    folder (in `<name>_files/`), holding that folder's children. The page loads
+    a chunk only when its folder is expanded, so neither writing nor viewing
+    the report has to go through the whole tree at once.
+    Folders arrive after their children, so when a folder is written its chunk
+    is complete and its recursive file and folder counts are known.
+    Chunks are JSON wrapped in a function call rather than .json files: browsers
+    refuse to fetch() local files but do load local scripts.
+    """
+    HIDDEN: tuple = (S_Name, S_Path, S_Fullpath, S_Type, S_Size)
+    TEMPLATE: str = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>__TITLE__</title>
+<style>
+body { font: 14px sans-serif; margin: 1em; }
+table { border-collapse: collapse; }
+th, td { padding: 2px 10px; text-align: left; white-space: nowrap; }
+th { background: #dde; position: sticky; top: 0; }
+tr:hover { background: #eef; }
+td.num { text-align: right; font-variant-numeric: tabular-nums; }
+tr.dir { cursor: pointer; }
+.tog { display: inline-block; width: 1em; color: #669; }
+.failed { color: #b00; }
+</style></head>
+<body>
+<h3>__TITLE__</h3>
+<table><thead><tr id="head"></tr></thead><tbody id="tree"></tbody></table>
+<script>
+const meta = __META__;
+const waiting = {};
+const walkdir = { loaded(id, rows) { const done = waiting[id]; delete waiting[id]; if (done) done(rows); } };
+function load(id, done) {
+    waiting[id] = done;
+    const s = document.createElement('script');
+    s.src = meta.dir + '/' + id + '.js';
+    document.head.appendChild(s);
+}
+function human(n) {
+    const units = ['B', 'KB', 'MB', 'GB', 'TB', 'PB'];
+    let i = 0;
+    while (n >= 1024 && i < units.length - 1) { n /= 1024; i++; }
+    return (i ? n.toFixed(1) : n) + ' ' + units[i];
+}
+function cell(tr, text, cls) {
+    const td = document.createElement('td');
+    td.textContent = text;
+    if (cls) td.className = cls;
+    tr.appendChild(td);
+    return td;
+}
+function makeRow(e, level) {
+    const [name, kind, size, files, dirs, chunk, ...extra] = e;
+    const tr = document.createElement('tr');
+    const isDir = kind === meta.dirKind;
+    const td = cell(tr, '');
+    td.style.paddingLeft = (0.3 + 1.2 * level) + 'em';
+    const tog = document.createElement('span');
+    tog.className = 'tog';
+    tog.textContent = chunk ? '▸' : '';
+    td.appendChild(tog);
+    td.appendChild(document.createTextNode(name));
+    cell(tr, meta.kinds[kind]);
+    cell(tr, human(size), 'num').title = size + ' bytes';
+    cell(tr, isDir ? files : '', 'num');
+    cell(tr, isDir ? dirs : '', 'num');
+    extra.forEach(v => cell(tr, v));
+    if (meta.result >= 0 && extra[meta.result] === 'Failed') tr.className = 'failed';
+    if (isDir) tr.classList.add('dir');
+    Object.assign(tr, { level: level, chunk: chunk, tog: tog, kids: null, open: false });
+    if (chunk) tr.onclick = () => toggle(tr);
+    return tr;
+}
+function setHidden(tr, hidden) {
+    for (const k of tr.kids || []) { k.hidden = hidden; if (k.open) setHidden(k, hidden); }
+}
+function toggle(tr) {
+    tr.open = !tr.open;
+    tr.tog.textContent = tr.open ? '▾' : '▸';
+    if (tr.kids) { setHidden(tr, !tr.open); return; }
+    load(tr.chunk, rows => {
+        let last = tr;
+        tr.kids = rows.map(e => { const r = makeRow(e, tr.level + 1); last.after(r); last = r; return r; });
+    });
+}
+['Name', 'Type', 'Size', 'Files', 'Folders'].concat(meta.columns).forEach(c => {
+    const th = document.createElement('th'); th.textContent = c; document.getElementById('head').appendChild(th);
+});
+const tree = document.getElementById('tree');
+meta.roots.forEach(e => { const tr = makeRow(e, 0); tree.appendChild(tr); if (tr.chunk) toggle(tr); });
+</script>
+</body></html>
+"""
+
+    def __init__(self, file: str, fields: list) -> None:
+        super().__init__(file, fields)
+        if len(fields) == 0:
+            fields = tuple(FIELDS.values())
+        fields = [f for f in fields if f.name not in IOHtmlExporter.HIDDEN]
+        self._fields = [f.name for f in fields]
+        self._getters = tuple([f.value for f in fields])
+        self._dir: str = os.path.splitext(file)[0] + '_files'
+        os.makedirs(self._dir, exist_ok=True)
+        self._pending: dict = {}
+        self._roots: list = []
+        self._chunks: int = 0
+
+    def _chunk(self, rows: list) -> int:
+        import json
+        self._chunks += 1
+        with open(os.path.join(self._dir, f'{self._chunks}.js'), 'w', encoding='utf-8') as f:
+            f.write(f'walkdir.loaded({self._chunks},{json.dumps(rows, separators=(",", ":"))});\n')
+        return self._chunks
+
+    def write(self, item: IOItem):
+        item.status = not item.failed
+        extra: list = [get(item) for get in self._getters]
+        with self._lock:
+            files: int = 0
+            dirs: int = 0
+            chunk: int = 0
+            if item.kind == IOKind.DIR:
+                rows: list = self._pending.pop(item, None)
+                if rows is not None:
+                    for row in rows:
+                        files += row[3] + (1 if row[1] == IOKind.FILE else 0)
+                        dirs += row[4] + (1 if row[1] == IOKind.DIR else 0)
+                    chunk = self._chunk(rows)
+            row: list = [item.name, int(item.kind), item.size, files, dirs, chunk] + extra
+            if item.parent is None:
+                row[0] = item.full_path
+                self._roots.append(row)
+            else:
+                self._pending.setdefault(item.parent, []).append(row)
+            self._count += 1
+
+    def close(self):
+        import json
+        if self._roots is None:
+            return
+        meta: dict = {
+            'dir': os.path.basename(self._dir),
+            'columns': self._fields,
+            'kinds': {int(k): k.name for k in IOKind},
+            'dirKind': int(IOKind.DIR),
+            'result': self._fields.index(S_Result) if S_Result in self._fields else -1,
+            'roots': self._roots,
+        }
+        title: str = ', '.join([row[0] for row in self._roots])
+        page: str = IOHtmlExporter.TEMPLATE.replace('__META__', json.dumps(meta).replace('</', '<\\/'))
+        page = page.replace('__TITLE__', title.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;'))
+        with open(self._file, 'w', encoding='utf-8', errors='surrogateescape') as f:
+            f.write(page)
+        self._roots = None
+
+class IOPipeline:
+    """
+    Sink that hands items over to another sink running on its own thread, so
+    that walking (mostly waiting on the file system) and exporting (formatting,
+    compressing) overlap. Items travel in batches through a bounded queue: when
+    the writer falls behind, the walker blocks, so at most about `size` items
+    are in flight. Writer errors are raised to the walker on its next write.
+    """
+    BATCH: int = 256
+
+    def __init__(self, sink, size: int) -> None:
+        import queue
+        self._sink = sink
+        self._queue: queue.Queue = queue.Queue(max(1, size // IOPipeline.BATCH))
+        self._lock: threading.Lock = threading.Lock()
+        self._batch: list = []
+        self._error: Exception = None
+        self._thread: threading.Thread = threading.Thread(target=self._run, name='walkdir-export', daemon=True)
+        self._thread.start()
+
+    @property
+    def count(self) -> int:
+        return self._sink.count
+
+    def _run(self):
+        while True:
+            batch: list = self._queue.get()
+            if batch is None:
+                break
+            if self._error is not None:
+                continue
+            try:
+                for item in batch:
+                    self._sink.write(item)
+            except Exception as ex:
+                self._error = ex
+
+    def write(self, item: IOItem):
+        if self._error is not None:
+            raise self._error
+        with self._lock:
+            self._batch.append(item)
+            if len(self._batch) < IOPipeline.BATCH:
+                return
+            batch: list = self._batch
+            self._batch = []
+        self._queue.put(batch)
+
+    def close(self):
+        if self._thread is not None:
+            with self._lock:
+                batch: list = self._batch
+                self._batch = []
+            self._queue.put(batch)
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self._sink.close()
+        if self._error is not None:
+            raise self._error
+
+class IOMetrics:
+    """
+    Walk metrics for monitoring, written atomically (to a temporary file that is
+    then renamed over `file`): Prometheus text format for node_exporter's
+    textfile collector, or JSON when `file` ends with .json.
+    """
+    def __init__(self, file: str) -> None:
+        self._file: str = file
+
+    @property
+    def file(self) -> str:
+        return self._file
+
+    @staticmethod
+    def _label(val: str) -> str:
+        return val.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def _prometheus(self, m: dict) -> str:
+        cmd: str = f'command="{IOMetrics._label(m["command"])}"'
+        lines: list = []
+        def metric(name: str, text: str, samples: list):
+            lines.append(f'# HELP walkdir_{name} {text}')
+            lines.append(f'# TYPE walkdir_{name} gauge')
+            for labels, val in samples:
+                lines.append(f'walkdir_{name}{{{", ".join([cmd] + labels)}}} {val}')
+        metric('success', 'Whether the last walk completed', [([], 1 if m['success'] else 0)])
+        metric('directories', 'Directories found by the last walk', [([], m['dir_count'])])
+        metric('files', 'Files found by the last walk', [([], m['file_count'])])
+        metric('links', 'Symbolic links found by the last walk', [([], m['link_count'])])
+        metric('root_bytes', 'Total size of each walked directory', [([f'root="{IOMetrics._label(r["path"])}"'], r['bytes']) for r in m['roots']])
+        metric('directory_bytes', 'Rolled-up size of the largest directories', [([f'path="{IOMetrics._label(d["path"])}"'], d['bytes']) for d in m['top_directories']])
+        metric('errors', 'Entries that could not be walked, by errno', [([f'errno="{IOMetrics._label(k)}"'], v) for k, v in m['errors'].items()])
+        metric('duration_seconds', 'Duration of the last walk', [([], m['duration_seconds'])])
+        metric('entries_per_second', 'Entries found per second by the last walk', [([], m['entries_per_second'])])
+        metric('last_run_timestamp_seconds', 'End time of the last walk', [([], m['timestamp'])])
+        return '\n'.join(lines) + '\n'
+
+    def save(self, metrics: dict):
+        import json
+        import tempfile
+        if self._file.lower().endswith('.json'):
+            text: str = json.dumps(metrics, indent=1, ensure_ascii=False)
+        else:
+            text: str = self._prometheus(metrics)
+        fd, tmp = tempfile.mkstemp(prefix='.walkdir-', dir=os.path.dirname(os.path.abspath(self._file)))
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8', errors='backslashreplace') as f:
+                f.write(text)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, self._file)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+class IOSummary:
+    """
+    Incremental per-extension, per-top-level-directory and per-depth totals of
+    the files it is given. Only the groups are kept, never the items.
+    """
+    S_None: str = '(none)'
+
+    def __init__(self, multi_root: bool = False) -> None:
+        self._multi_root: bool = multi_root
+        self._lock: threading.Lock = threading.Lock()
+        self._count: int = 0
+        self._extensions: dict = {}
+        self._tops: dict = {}
+        self._depths: dict = {}
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def extensions(self) -> dict:
+        return self._extensions
+
+    @property
+    def tops(self) -> dict:
+        return self._tops
+
+    @property
+    def depths(self) -> dict:
+        return self._depths
+
+    @staticmethod
+    def _add(groups: dict, key, files: int, size: int, dirs: int):
+        totals: list = groups.get(key)
+        if totals is None:
+            totals = [0, 0, 0]
+            groups[key] = totals
+        totals[0] += files
+        totals[1] += size
+        totals[2] += dirs
+
+    def write(self, item: IOItem):
+        level: int = 0
+        top: IOItem = item
+        node: IOItem = item
+        while node.parent is not None:
+            top = node
+            node = node.parent
+            level += 1
+        top_name: str = top.name if top.kind == IOKind.DIR else '.'
+        if self._multi_root:
+            top_name = os.path.join(node.name, top_name)
+        files: int = 0
+        size: int = 0
+        dirs: int = 0
+        if item.kind == IOKind.DIR:
+            dirs = 1
+        elif item.kind == IOKind.FILE:
+            files = 1
+            size = item.size
+        with self._lock:
+            self._count += 1
+            if item.kind == IOKind.FILE:
+                IOSummary._add(self._extensions, item.extension or IOSummary.S_None, files, size, dirs)
+            IOSummary._add(self._tops, top_name, files, size, dirs)
+            IOSummary._add(self._depths, level, files, size, dirs)
+
+    def close(self):
+        pass
+
+class IOTimedCall:
+    """
+    Run one blocking file system call (a directory listing, a stat) in a daemon
+    thread and wait for it at most `timeout` seconds.
+    A call that times out keeps its listing slot until it returns, so a hung
+    mount can hold at most as many threads as there are slots. Whatever it
+    returns after it was abandoned is handed to `cleanup` (e.g. to close an fd).
+    """
+    def __init__(self, slots: threading.Semaphore, fn, args: tuple, kwargs: dict, cleanup = None) -> None:
+        self._slots: threading.Semaphore = slots
+        self._fn = fn
+        self._args: tuple = args
+        self._kwargs: dict = kwargs
+        self._cleanup = cleanup
+        self._done: threading.Event = threading.Event()
+        self._lock: threading.Lock = threading.Lock()
+        self._abandoned: bool = False
+        self._result = None
+        self._error: BaseException = None
+
+    def _run(self):
+        try:
+            self._result = self._fn(*self._args, **self._kwargs)
+        except BaseException as ex:
+            self._error = ex
+        finally:
+            self._slots.release()
+            with self._lock:
+                self._done.set()
+                abandoned: bool = self._abandoned
+            if abandoned and self._error is None and self._cleanup is not None:
+                try:
+                    self._cleanup(self._result)
+                except OSError:
+                    pass
+
+    def wait(self, timeout: float, item: IOItem):
+        started: float = time.monotonic()
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(f'No free listing slot for {item.full_path} within {timeout:g}s')
+        threading.Thread(target=self._run, name='walkdir-listing', daemon=True).start()
+        self._done.wait(max(0, timeout - (time.monotonic() - started)))
+        with self._lock:
+            if not self._done.is_set():
+                self._abandoned = True
+                raise TimeoutError(f'Timed out after {timeout:g}s on {item.full_path}')
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+def _socket_address(address: str) -> tuple:
+    """
+    (family, address) of a `host:port` or `unix:path` socket address.
+    """
+    import socket
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    host, sep, port = address.rpartition(':')
+    if len(sep) == 0 or not port.isdigit():
+        raise ValueError(f'Invalid address "{address}": expected host:port or unix:path')
+    host = host.strip('[]')
+    return (socket.AF_INET6 if ':' in host else socket.AF_INET), (host, int(port))
+
+def _is_local_address(address: str) -> bool:
+    """
+    Whether only processes of this host can connect to `address`.
+    """
+    import ipaddress
+    import socket
+    family, address = _socket_address(address)
+    if family == socket.AF_UNIX:
+        return True
+    try:
+        return ipaddress.ip_address(address[0]).is_loopback
+    except ValueError:
+        return address[0] == 'localhost'
+
+class IOChannel:
+    """
+    Messages over a stream socket. A message is a JSON header plus an optional
+    binary payload, sent as (header length, payload length, header, payload).
+    """
+    HEADER: str = '>IQ'
+    MAX_HEADER: int = 1 << 20
+
+    def __init__(self, sock) -> None:
+        self._sock = sock
+        self._reader = sock.makefile('rb')
+        self._lock: threading.Lock = threading.Lock()
+        self._closed: threading.Event = threading.Event()
+
+    def send(self, msg: dict, payload: bytes = b''):
+        import json
+        import struct
+        head: bytes = json.dumps(msg).encode('utf-8')
+        with self._lock:
+            self._sock.sendall(struct.pack(IOChannel.HEADER, len(head), len(payload)) + head)
+            if len(payload) > 0:
+                self._sock.sendall(payload)
+
+    def _read(self, size: int) -> bytes:
+        data: bytes = self._reader.read(size)
+        if data is None or len(data) < size:
+            raise ConnectionError('Connection closed by peer')
+        return data
+
+    def recv(self, max_payload: int = None) -> tuple:
+        """
+        Returns (header, payload) of the next message.
+        """
+        import json
+        import struct
+        head_size, payload_size = struct.unpack(IOChannel.HEADER, self._read(struct.calcsize(IOChannel.HEADER)))
+        if head_size > IOChannel.MAX_HEADER or (max_payload is not None and payload_size > max_payload):
+            raise ValueError('Message is too large')
+        msg: dict = json.loads(self._read(head_size))
+        if not isinstance(msg, dict):
+            raise ValueError('Malformed message')
+        return msg, self._read(payload_size) if payload_size > 0 else b''
+
+    def heartbeat(self, interval: float):
+        """
+        Send an 'alive' message every `interval` seconds until the channel is closed.
+        """
+        def beat():
+            while not self._closed.wait(interval):
+                try:
+                    self.send({'op': 'alive'})
+                except OSError:
+                    return
+        threading.Thread(target=beat, name='walkdir-heartbeat', daemon=True).start()
+
+    def close(self):
+        self._closed.set()
+        try:
+            self._reader.close()
+            self._sock.close()
+        except OSError:
+            pass
+
+class IOCoordinator:
+    """
+    Hand the shards of a walk (sub-directory names) out to worker processes that
+    connect over TCP (host:port) or a Unix socket (unix:path), one shard at a
+    time, and collect the subtrees they send back as snapshots.
+    A worker that disconnects or stays silent for `timeout` seconds is dropped
+    and its shard is handed out again. While no worker is connected for
+    `timeout` seconds, pending shards are walked locally instead.
+    Results are kept as received, in snapshot form, until result() takes them.
+    """
+    MAX_RESULT: int = 1 << 32
+    def __init__(self, address: str, token: str, options: dict, timeout: float, tag = None) -> None:
+        import collections
+        self._address: str = address
+        self._token: str = token
+        self._options: dict = options
+        self._timeout: float = timeout
+        self._tag = tag
+        self._server = None
+        self._cond: threading.Condition = threading.Condition()
+        self._pending: collections.deque = collections.deque()
+        self._results: dict = {}
+        self._done: set = set()
+        self._total: int = 0
+        self._live: int = 0
+        self._idle_since: float = 0
+        self._closing: bool = False
+        self._threads: list = []
+        self._processes: list = []
+        self._verbose: bool = False
+
+    @property
+    def address(self) -> str:
+        """The address the coordinator listens on, with the actual port"""
+        import socket
+        if self._server is None or self._server.family == socket.AF_UNIX:
+            return self._address
+        host, port = self._server.getsockname()[:2]
+        return f'[{host}]:{port}' if ':' in host else f'{host}:{port}'
+
+    @property
+    def local_address(self) -> str:
+        """The address workers on this host connect to"""
+        address: str = self.address
+        if address.startswith('0.0.0.0:'):
+            return '127.0.0.1' + address[len('0.0.0.0'):]
+        if address.startswith('[::]:'):
+            return '[::1]' + address[len('[::]'):]
+        return address
+
+    @property
+    def options(self) -> dict:
+        """The walk options handed to the workers"""
+        return self._options
+
+    @property
+    def verbose(self) -> bool:
+        return self._verbose
+    @verbose.setter
+    def verbose(self, val: bool):
+        self._verbose = val
+
+    def start(self):
+        import socket
+        family, address = _socket_address(self._address)
+        self._server = socket.socket(family, socket.SOCK_STREAM)
+        if family != socket.AF_UNIX:
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(address)
+        self._server.listen()
+        self._server.settimeout(0.5)
+        threading.Thread(target=self._accept, name='walkdir-accept', daemon=True).start()
+
+    def _accept(self):
+        while not self._closing:
+            try:
+                conn, _ = self._server.accept()
+            except TimeoutError:
+                continue
+            except OSError:
+                return
+            thread: threading.Thread = threading.Thread(target=self._serve, args=(conn,), name='walkdir-worker', daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _serve(self, conn):
+        import hmac
+        channel: IOChannel = IOChannel(conn)
+        worker: str = 'worker'
+        shard: str = None
+        joined: bool = False
+        try:
+            conn.settimeout(self._timeout)
+            msg, _ = channel.recv(0)
+            if msg.get('op') != 'hello' or not hmac.compare_digest(str(msg.get('token', '')), self._token):
+                channel.send({'op': 'reject', 'reason': 'Wrong token or protocol'})
+                return
+            worker = f'{msg.get("host")}:{msg.get("pid")}'
+            channel.send({'op': 'welcome', 'options': self._options, 'heartbeat': self._timeout / 4})
+            with self._cond:
+                self._live += 1
+                joined = True
+            if self._verbose:
+                print(f'\nWorker {worker} joined')
+            while True:
+                shard = self._take()
+                if shard is None:
+                    channel.send({'op': 'done'})
+                    return
+                channel.send({'op': 'shard', 'name': shard})
+                msg, payload = channel.recv(IOCoordinator.MAX_RESULT)
+                while msg.get('op') == 'alive':
+                    msg, payload = channel.recv(IOCoordinator.MAX_RESULT)
+                if msg.get('op') != 'result' or msg.get('name') != shard:
+                    raise ValueError(f'Unexpected {msg.get("op")} message')
+                self._complete(shard, (payload, msg.get('errors', {})), worker)
+                shard = None
+        except (OSError, ValueError) as ex:
+            if shard is not None:
+                print(f'\nWorker {worker} is lost ({ex}), shard {shard} is handed out again')
+                self._requeue(shard)
+        finally:
+            if joined:
+                with self._cond:
+                    self._live -= 1
+                    if self._live == 0:
+                        self._idle_since = time.monotonic()
+                    self._cond.notify_all()
+            channel.close()
+
+    def _take(self) -> str:
+        with self._cond:
+            while len(self._pending) == 0 and len(self._done) < self._total and not self._closing:
+                self._cond.wait()
+            if len(self._pending) == 0 or self._closing:
+                return None
+            return self._pending.popleft()
+
+    def _requeue(self, shard: str):
+        with self._cond:
+            if shard not in self._done:
+                self._pending.appendleft(shard)
+                self._cond.notify_all()
+
+    def _complete(self, shard: str, result: tuple, worker: str):
+        with self._cond:
+            if shard in self._done:
+                return
+            self._done.add(shard)
+            self._results[shard] = result
+            done: int = len(self._done)
+            self._cond.notify_all()
+        if self._verbose:
+            print(f'Shard {shard} is walked by {worker} ({done}/{self._total})')
+        else:
+            print(f'\rShards walked: {done}/{self._total}', end='')
+
+    def submit(self, shards: list):
+        with self._cond:
+            self._pending.extend(shards)
+            self._total += len(shards)
+            self._idle_since = time.monotonic()
+            self._cond.notify_all()
+
+    def spawn(self, args: list, count: int):
+        """
+        Start `count` local worker processes: `args` followed by --connect.
+        """
+        import subprocess
+        for i in range(count):
+            self._processes.append(subprocess.Popen(args + ['--connect', self.local_address], stdout=subprocess.DEVNULL, env=dict(os.environ, WALKDIR_TOKEN=self._token)))
+
+    def result(self, shard: str, walk) -> tuple:
+        """
+        Wait for `shard` and return its (subtree, counters, errors).
+        `walk(shard)` walks a shard locally and returns the same tuple.
+        """
+        while True:
+            local: str = None
+            with self._cond:
+                if shard in self._results:
+                    payload, errors = self._results.pop(shard)
+                    try:
+                        roots, _, counters = IOSnapshot(f'shard {shard}').loads(payload, self._tag)
+                        return roots[0], counters, errors
+                    except (ValueError, IndexError) as ex:
+                        print(f'\nShard {shard} is unreadable ({ex}), it is handed out again')
+                        self._done.discard(shard)
+                        self._pending.appendleft(shard)
+                        self._cond.notify_all()
+                        continue
+                if self._live == 0 and len(self._pending) > 0 and time.monotonic() - self._idle_since >= self._timeout:
+                    local = shard if shard in self._pending else self._pending[0]
+                    self._pending.remove(local)
+                else:
+                    self._cond.wait(1)
+                    continue
+            print(f'\nNo worker is connected, walking shard {local} locally')
+            subtree, counters, errors = walk(local)
+            self._complete(local, (IOSnapshot(local).dumps([subtree], S_Empty, counters), errors), 'coordinator')
+
+    def close(self):
+        import socket
+        import subprocess
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        if self._server is None:
+            return
+        family: int = self._server.family
+        self._server.close()
+        for thread in list(self._threads):
+            thread.join(self._timeout)
+        for p in self._processes:
+            try:
+                p.wait(self._timeout)
+            except subprocess.TimeoutExpired:
+                p.kill()
+                p.wait()
+        if family == socket.AF_UNIX:
+            try:
+                os.remove(_socket_address(self._address)[1])
+            except OSError:
+                pass
+
 class Command:
+    BFS_FRONTIER: int = 100000
+    # Seconds between two updates of the 'Walking on' line
+    PROGRESS_INTERVAL: float = 0.1
+    SORT_KEYS: dict = {
+        'size': lambda item: item.size,
+        'name': lambda item: item.name,
+        'mtime': lambda item: item.mtime,
+        'ext': lambda item: (item.extension, item.name),
+    }
+    # Walk options a coordinator hands to its workers
+    SHARD_OPTIONS: tuple = ('exclude', 'recursive', 'follow_links', 'one_file_system', 'fd_walk', 'traversal', 'max_depth', 'dir_timeout', 'max_listings')
+
     def __init__(self, name: str, desc: str = '', dir: str = '') -> None:
         self._dir: IOFolder = None
+        self._dirs: list = []
+        self._walkers: list = []
         self._dir_count: int = 0
         self._file_count: int = 0
         self._link_count: int = 0
@@ -490,6 +2016,21 @@ class Command:
         self._prev_working_dir: str = os.curdir
         self._options: optparse.Option = None
         self._org_working_dir: str = os.path.abspath(os.curdir)
+        self._excludes: list = None
+        self._real_root: str = None
+        self._visited: dict = {}
+        self._stop: threading.Event = threading.Event()
+        self._progress_at: float = 0
+        self._root_dev: int = 0
+        self._node_count: int = 0
+        self._spill_store: IOSpillStore = None
+        self._journal: IOJournal = None
+        self._sink: IOStreamExporter = None
+        self._release_tree: bool = False
+        self._listing_slots: threading.Semaphore = None
+        self._top_dirs: list = None
+        self._item_stat: bool = False
+        self._errors: dict = {}
     
     @property
     def name(self) -> str:
@@ -506,6 +2047,12 @@ class Command:
     @property
     def directory(self) -> IOFolder:
         return self._dir
+
+    @property
+    def directories(self) -> list:
+        if len(self._dirs) == 0 and self._dir is not None:
+            self._dirs.append(self._dir)
+        return self._dirs
     
     @property
     def dir_count(self) -> int:
@@ -616,9 +2163,30 @@ class Command:
 
     def _onAddOptions(self, parser:optparse.OptionParser):
         parser.add_option('-v', '--verbose', action="store_false", help='Verbose output logs')
-        parser.add_option('-o', '--output', help='Output file to store result. Default is result.xlsx')
+        parser.add_option('-o', '--output', help='Output file to store result: .xlsx, .sqlite, .html (index page plus per-folder chunks), or .csv/.jsonl (optionally .gz/.zst compressed) to stream rows while walking')
         parser.add_option('-x', '--exclude', help='Exclude patterns. Comma separated')
         parser.add_option('-r', '--recursive', action="store_false", help='Walk recursively')
+        parser.add_option('-L', '--follow-links', action="store_false", help='Follow symbolic links to directories (cycles are detected and skipped)')
+        parser.add_option('--one-file-system', action="store_false", help='Do not descend into directories on other file systems')
+        parser.add_option('-j', '--jobs', type='int', help='Number of worker threads shared by all directories when several are given')
+        parser.add_option('--memory-limit', type='int', help='Maximum number of walked items kept in memory. Completed subtrees beyond it are spilled to a temporary SQLite store')
+        parser.add_option('--checkpoint', help='Journal file to checkpoint the walk into, so that it can be resumed')
+        parser.add_option('--checkpoint-interval', type='float', default=30, help='Seconds between checkpoint flushes. Default is 30')
+        parser.add_option('--resume', action="store_false", help='Resume the walk recorded in the --checkpoint journal')
+        parser.add_option('--save-snapshot', help='Save the walked tree to a binary snapshot file (.gz/.xz to compress) for the render command')
+        parser.add_option('--fd-walk', action="store_false", help='Walk through directory file descriptors (openat-style) instead of full paths')
+        parser.add_option('--metrics-file', help='Write walk metrics (counts, top directory sizes, errors, duration) to this file, atomically: Prometheus text format, or JSON for .json')
+        parser.add_option('--metrics-top', type='int', default=10, help='Number of largest directories in --metrics-file. Default is 10')
+        parser.add_option('--dir-timeout', type='float', help='Seconds to wait for one directory listing (in a worker thread) before marking the directory as timed out and moving on')
+        parser.add_option('--traversal', type='choice', choices=['dfs', 'bfs'], default='dfs', help='Walk order: dfs (depth-first, default) or bfs (breadth-first, level by level)')
+        parser.add_option('--max-depth', type='int', help='Do not list directories more than N levels below the given directory (implies --recursive)')
+        parser.add_option('--sort', type='choice', choices=list(Command.SORT_KEYS.keys()), help='Order the entries of every directory by size (of the whole subtree for folders), name, mtime or ext')
+        parser.add_option('--reverse', action="store_false", help='Reverse the --sort order')
+        parser.add_option('--limit', type='int', help='Stop walking a directory tree once N entries are found')
+        parser.add_option('--max-listings', type='int', default=8, help='Maximum number of directory listings in flight with --dir-timeout, hung ones included. Default is 8')
+        parser.add_option('--coordinator', help='Hand the sub-directories of the directory out to worker processes (see the worker command) that connect to this address: host:port or unix:path. Workers must have the same WALKDIR_TOKEN environment variable as the coordinator, which is required unless the address is a loopback or Unix socket one. With -L, a link from one sub-directory into another is walked in both')
+        parser.add_option('--workers', type='int', help='Start N local worker processes for --coordinator (which defaults to 127.0.0.1:0 then)')
+        parser.add_option('--worker-timeout', type='float', default=60, help='Seconds of silence after which a worker is dropped and its shard is handed out again; shards are walked locally when no worker is connected for as long. Default is 60')
 
     def _onOptionsParsed(self):
         pass
@@ -630,78 +2198,801 @@ class Command:
         if rex.match(name):
             return True
         return False
-    
-    def _walk(self, root : IOFolder) -> IOFolder:
+
+    def _exclude_patterns(self) -> list:
+        if not isinstance(self.options.exclude, str):
+            return []
+        if self._excludes is None:
+            self._excludes = []
+            for x in self.options.exclude.split(','):
+                x = x.strip()
+                self._excludes.append(re.compile('^' + x.replace('*',  '.*').replace('?', '.') + '$'))
+        return self._excludes
+
+    def _is_excluded(self, name: str) -> bool:
+        for rex in self._exclude_patterns():
+            if rex.match(name):
+                if self.options.verbose is not None:
+                    print(f'Ignoring {name}...')
+                return True
+        return False
+
+    def _use_fd_walk(self) -> bool:
+        if getattr(self.options, 'fd_walk', None) is None:
+            return False
+        return os.scandir in os.supports_fd and os.open in os.supports_dir_fd
+
+    def _print_walking(self, root: IOFolder):
+        self._print_progress('Walking on', root, 150)
+
+    def _print_progress(self, action: str, item: IOItem, width: int):
+        """
+        Print `action` and the path of `item`: every item with -v, otherwise at
+        most every PROGRESS_INTERVAL, overwriting the previous progress line.
+        """
         if self.options.verbose is not None:
-            print(f'Walking on {root.full_path}')
+            print(f'{action} {item.full_path}')
+            return
+        now: float = time.monotonic()
+        if now - self._progress_at < Command.PROGRESS_INTERVAL:
+            return
+        self._progress_at = now
+        line: str = f'{action} {self._shorten_path(item.full_path, 128)}'
+        print(f'\r{line}{" "*(width-len(line))}', end='\r')
+
+    def _adjust_depth(self, root: IOFolder, current: IOItem):
+        current.parent = root
+        if current.parent.depth <= current.depth:
+            current.parent.depth = current.depth + 1
         else:
-            line: str = f'Walking on {self._shorten_path(root.full_path, 128)}'
-            print(f'\r{line}{" "*(150-len(line))}', end='\r')
-        subpaths = os.listdir(root.full_path)
-        abs_path: str = ''
-        ignored: bool = False
-        for path in subpaths:
-            if root.depth == 0:
-                root.depth = 1
-            ignored = False
-            if isinstance(self.options.exclude, str):
-                excludes: list = self.options.exclude.split(',')
-                for x in excludes:
-                    if self._is_matched(path, x.strip()):
-                        ignored = True
-                        break
-            if ignored:
-                if self.options.verbose is not None:
-                    print(f'Ignoring {path}...')
-                continue
-            abs_path = os.path.join(root.full_path, path)
-            current: IOItem = None
-            if os.path.isdir(abs_path):
-                current = IOFolder(path, root.full_path, 0, root)
-                current.parent = root
-                current.tag = self
-                self._dir_count += 1
-                if current.parent.depth <= current.depth:
-                    current.parent.depth = current.depth + 1
-                else:
-                    current.depth = current.parent.depth - 1
-                if self.options.recursive is not None:
-                    current = self._walk(current)
-            elif os.path.islink(abs_path):
-                current = IOLink(path, root.full_path, 0, root)
-                current.tag = self
-                self._link_count += 1
-            else:
-                current = IOFile(path, root.full_path, 0, root)
-                current.tag = self
-                self._file_count += 1
-            current.parent = root
-            if current.parent.depth <= current.depth:
-                current.parent.depth = current.depth + 1
-            else:
-                current.depth = current.parent.depth - 1
-            current.parent.size += current.size
-            root.children.append(current)
-        return root
+            current.depth = current.parent.depth - 1
 
-    def parse_args(self, options) -> bool:
-        parser: optparse.OptionParser = optparse.OptionParser(f'%prog {self._name} [options]')
-        self._onAddOptions(parser)
+    def _maybe_spill(self, folder: IOFolder):
+        limit = getattr(self.options, 'memory_limit', None)
+        if limit is None or self._node_count <= limit:
+            return
+        if self._spill_store is None:
+            self._spill_store = IOSpillStore(self)
+            if self.options.verbose is not None:
+                print(f'Spilling completed subtrees to {self._spill_store.file}')
+        self._node_count -= self._spill_store.spill(folder)
+
+    def _add_item(self, root: IOFolder, current: IOItem):
+        self._finish_item(root, current)
+        root.children.append(current)
+
+    def _finish_item(self, root: IOFolder, current: IOItem):
+        """
+        Account for a complete item (a folder with its whole subtree) of `root`.
+        """
+        self._node_count += 1
+        self._adjust_depth(root, current)
+        current.parent.size += current.size
+        if self._top_dirs is not None and current.kind == IOKind.DIR:
+            self._track_top(current)
+        if self._sink is not None and self.options.sort is None:
+            self._sink.write(current)
+            if self._release_tree and current.kind == IOKind.DIR:
+                current._childs = []
+
+    def _track_top(self, folder: IOFolder):
+        """
+        Keep the --metrics-top largest complete folders in a min-heap.
+        """
+        import heapq
+        if len(self._top_dirs) < self.options.metrics_top:
+            heapq.heappush(self._top_dirs, (folder.size, folder.full_path))
+        elif folder.size > self._top_dirs[0][0]:
+            heapq.heapreplace(self._top_dirs, (folder.size, folder.full_path))
 
+    def _save_metrics(self, completed: bool, started: float):
+        if self.options.metrics_file is None:
+            return
+        import heapq
+        duration: float = time.monotonic() - started
+        entries: int = self._dir_count + self._file_count + self._link_count
+        tops: list = self._top_dirs if self._top_dirs is not None else []
+        for w in self._walkers:
+            if w._top_dirs is not None:
+                tops = tops + w._top_dirs
+        metrics: dict = {
+            'command': self.name,
+            'success': completed,
+            'dir_count': self._dir_count,
+            'file_count': self._file_count,
+            'link_count': self._link_count,
+            'roots': [{'path': d.full_path, 'bytes': d.size} for d in self.directories],
+            'top_directories': [{'path': p, 'bytes': size} for size, p in heapq.nlargest(max(0, self.options.metrics_top), tops)],
+            'errors': dict(self._errors),
+            'duration_seconds': round(duration, 3),
+            'entries_per_second': round(entries / duration, 1) if duration > 0 else 0,
+            'timestamp': round(time.time(), 3),
+        }
         try:
-            opts, args = parser.parse_args(options)
-            self._options = opts
-        except Exception as ex:
+            IOMetrics(self.options.metrics_file).save(metrics)
+        except OSError as ex:
             print(ex)
-            parser.print_help()
-            return False
-        self._onOptionsParsed()
+
+    def _sort_children(self, folder: IOFolder):
+        """
+        Order the children of a complete folder by --sort. With a sink, they are
+        written now, as one block: the child list the walk keeps anyway is the
+        only buffer, and folders still reach the sink after their children.
+        """
+        key = Command.SORT_KEYS.get(self.options.sort)
+        if key is None:
+            return
+        children: list = folder.children
+        children.sort(key=key, reverse=self.options.reverse is not None)
+        if self._sink is not None:
+            for child in children:
+                self._sink.write(child)
+                if self._release_tree and child.kind == IOKind.DIR:
+                    child._childs = []
+
+    def _walk_options(self) -> dict:
+        """
+        The options that decide which entries a walk lists, as saved in snapshots.
+        """
+        return {
+            'recursive': self.options.recursive is not None,
+            'max_depth': getattr(self.options, 'max_depth', None),
+            'exclude': self.options.exclude,
+            'follow_links': self.options.follow_links is not None,
+            'one_file_system': self.options.one_file_system is not None,
+        }
+
+    def _budget(self) -> int:
+        """
+        How many more entries --limit lets the walk list, None without a limit.
+        """
+        limit: int = getattr(self.options, 'limit', None)
+        if limit is None:
+            return None
+        return max(0, limit - (self._dir_count + self._file_count + self._link_count))
+
+    def _limit_reached(self) -> bool:
+        budget: int = self._budget()
+        return budget is not None and budget == 0
+
+    def _level(self, item: IOItem) -> int:
+        level: int = 0
+        while item.parent is not None:
+            item = item.parent
+            level += 1
+        return level
+
+    def _can_descend(self, folder: IOFolder, st: os.stat_result) -> bool:
+        max_depth: int = getattr(self.options, 'max_depth', None)
+        if self.options.recursive is None and max_depth is None:
+            return False
+        if max_depth is not None and self._level(folder) >= max_depth:
+            return False
+        if self._limit_reached():
+            return False
+        if st is None:
+            return True
+        if self.options.one_file_system is not None and st.st_dev != self._root_dev:
+            if self.options.verbose is not None:
+                print(f'Skipping {folder.full_path} (other file system)')
+            return False
+        if self.options.follow_links is not None:
+            key: tuple = (st.st_dev, st.st_ino)
+            if key in self._visited:
+                # A loop, or a folder reached again through another link: walked once, not an error
+                if self.options.verbose is not None:
+                    print(f'Skipping {folder.full_path} (already walked via {self._visited[key]})')
+                return False
+            if os.path.islink(folder.full_path):
+                # Links may be listed before the folder they point to, which then keeps its own contents
+                target: str = os.path.realpath(folder.full_path)
+                if self._walked_physically(target):
+                    if self.options.verbose is not None:
+                        print(f'Skipping {folder.full_path} (walked at {target})')
+                    return False
+            self._visited[key] = folder.full_path
+        return True
+
+    def _walked_physically(self, target: str) -> bool:
+        """
+        Whether the walk reaches the folder `target` (a resolved link target)
+        without following links: it is inside the walked root, below no excluded
+        folder and above --max-depth.
+        """
+        if self._real_root is None:
+            return False
+        rel: str = os.path.relpath(target, self._real_root)
+        if rel == os.curdir:
+            return True
+        parts: list = rel.split(os.sep)
+        if parts[0] == os.pardir:
+            return False
+        max_depth: int = getattr(self.options, 'max_depth', None)
+        if max_depth is not None and len(parts) >= max_depth:
+            return False
+        return not any([rex.match(part) for part in parts for rex in self._exclude_patterns()])
+
+    def _need_dir_stat(self) -> bool:
+        return self._item_stat or self.options.one_file_system is not None or self.options.follow_links is not None or self._journal is not None or self.options.sort == 'mtime' or getattr(self.options, 'stat_dirs', None) is not None
+
+    def _wants_item_stat(self) -> bool:
+        """
+        Whether the output shows what the stat of an item holds (mtime, mode,
+        owner, inode), so that --fd-walk must stat folders too.
+        """
+        return self.options.save_snapshot is not None
+
+    def _call_timed(self, item: IOItem, fn, *args, cleanup = None, **kwargs):
+        if self._listing_slots is None:
+            return fn(*args, **kwargs)
+        return IOTimedCall(self._listing_slots, fn, args, kwargs, cleanup).wait(self.options.dir_timeout, item)
+
+    def _onError(self, item: IOItem, ex: Exception):
+        """
+        Record a failed stat, open or listing on the item it belongs to and keep
+        walking. Errors are counted by errno for the summary printed at the end.
+        """
+        code: int = getattr(ex, 'errno', None)
+        key: str = errno.errorcode.get(code, type(ex).__name__) if code is not None else type(ex).__name__
+        self._errors[key] = self._errors.get(key, 0) + 1
+        item.remark = str(ex)
+        if self.options.verbose is not None or isinstance(ex, TimeoutError):
+            print(f'\n{ex}')
+
+    def _print_errors(self):
+        if len(self._errors) == 0:
+            return
+        print(f'\n{sum(self._errors.values())} entries could not be walked:')
+        for key, count in sorted(self._errors.items(), key=lambda kv: -kv[1]):
+            code: int = getattr(errno, key, None)
+            reason: str = f' ({os.strerror(code)})' if isinstance(code, int) else S_Empty
+            print(f'  {key}{reason}: {count}')
+
+    def _walk(self, root : IOFolder) -> IOFolder:
+        try:
+            st: os.stat_result = self._call_timed(root, os.stat, root.full_path)
+        except OSError as ex:
+            self._onError(root, ex)
+            return root
+        root.set_stat(st)
+        self._root_dev = st.st_dev
+        self._visited = {(st.st_dev, st.st_ino): root.full_path}
+        self._real_root = os.path.realpath(root.full_path) if self.options.follow_links is not None else None
+        if self._coordinator_address() is not None:
+            return self._walk_distributed(root)
+        if self.options.traversal == 'bfs':
+            return self._walk_bfs(root)
+        return self._walk_from(root)
+
+    def _coordinator_address(self) -> str:
+        address: str = getattr(self.options, 'coordinator', None)
+        if address is None and getattr(self.options, 'workers', None) is not None:
+            address = '127.0.0.1:0'
+        return address
+
+    def _walk_distributed(self, root: IOFolder) -> IOFolder:
+        """
+        Walk `root` with worker processes. The coordinator lists `root` itself;
+        its sub-directories are the shards, each walked whole by one worker and
+        sent back as a snapshot. The subtrees are then finished in listing order,
+        as a local depth-first walk would, so the result is the same.
+        """
+        if self._use_fd_walk():
+            entries: list = self._scan_opened_folder(root)
+        else:
+            entries: list = self._scan_folder(root)
+        if entries is None:
+            return root
+        items: list = []
+        shards: list = []
+        for name, kind, st in entries:
+            error: OSError = None
+            if isinstance(st, OSError):
+                error = st
+                st = None
+            current: IOItem = self._new_item(root, name, kind, st)
+            if error is not None:
+                self._onError(current, error)
+            elif kind == IOKind.DIR and self._can_descend(current, st):
+                shards.append(name)
+            items.append(current)
+        names: set = set(shards)
+        coordinator: IOCoordinator = None
+        try:
+            if len(shards) > 0:
+                coordinator = self._start_coordinator(root, shards)
+            for current in items:
+                if root.depth == 0:
+                    root.depth = 1
+                if current.kind == IOKind.DIR and not current.failed:
+                    self._adjust_depth(root, current)
+                if coordinator is not None and current.kind == IOKind.DIR and current.name in names:
+                    # Shards are finished in listing order, as they come
+                    subtree, counters, errors = coordinator.result(current.name, lambda name: self._walk_shard(root.full_path, name, coordinator.options))
+                    current._childs = subtree.children
+                    for child in current._childs:
+                        child.parent = current
+                    if subtree.remark is not None:
+                        current.remark = subtree.remark
+                    self._dir_count += counters[0]
+                    self._file_count += counters[1]
+                    self._link_count += counters[2]
+                    for key, count in errors.items():
+                        self._errors[key] = self._errors.get(key, 0) + count
+                    self._finish_subtree(current)
+                    self._maybe_spill(current)
+                self._add_item(root, current)
+        finally:
+            if coordinator is not None:
+                coordinator.close()
+                print()
+        self._sort_children(root)
+        return root
+
+    def _start_coordinator(self, root: IOFolder, shards: list) -> IOCoordinator:
+        import secrets
+        address: str = self._coordinator_address()
+        token: str = os.environ.get('WALKDIR_TOKEN', S_Empty)
+        if len(token) == 0:
+            if not _is_local_address(address):
+                raise ValueError(f'--coordinator {address} accepts workers from other hosts: set the same WALKDIR_TOKEN for the coordinator and the workers')
+            if self.options.workers is not None:
+                # Only the workers started here know it
+                token = secrets.token_hex(16)
+        coordinator: IOCoordinator = IOCoordinator(address, token, self._shard_options(), self.options.worker_timeout, self)
+        coordinator.verbose = self.options.verbose is not None
+        try:
+            coordinator.start()
+        except OSError:
+            coordinator.close()
+            raise
+        print(f'\nHanding {len(shards)} shards of {root.full_path} out on {coordinator.address}')
+        coordinator.submit(shards)
+        if self.options.workers is not None:
+            coordinator.spawn([sys.executable, os.path.abspath(__file__), root.full_path, 'worker'], self.options.workers)
+        return coordinator
+
+    def _shard_options(self) -> dict:
+        options: dict = {key: getattr(self.options, key, None) for key in Command.SHARD_OPTIONS}
+        if options['max_depth'] is not None:
+            # A shard is walked from one level below the directory
+            options['max_depth'] -= 1
+        # Workers keep the listing order, which depths are computed in; the
+        # coordinator sorts while it finishes the subtrees
+        options['sort'] = None
+        options['reverse'] = None
+        options['stat_dirs'] = True if self.options.sort == 'mtime' or self._item_stat else None
+        return options
+
+    def _walk_shard(self, path: str, name: str, options: dict) -> tuple:
+        """
+        Walk the shard `name` of the directory `path` with the coordinator's walk
+        `options`. Returns (subtree, counters, errors).
+        """
+        walker: Command = self._new_walker()
+        walker._options = copy.copy(self.options)
+        for key, val in options.items():
+            setattr(walker._options, key, val)
+        walker._options.coordinator = None
+        walker._options.workers = None
+        walker._options.memory_limit = None
+        walker._excludes = None
+        walker._sink = None
+        walker._release_tree = False
+        walker._journal = None
+        walker._top_dirs = None
+        if walker.options.dir_timeout is not None:
+            walker._listing_slots = threading.BoundedSemaphore(max(1, walker.options.max_listings))
+        subtree: IOFolder = IOFolder(name, path)
+        try:
+            subtree = walker._walk(subtree)
+        except Exception as ex:
+            # A shard that cannot be walked to the end is kept as far as it got,
+            # not handed out again to fail the same way
+            walker._onError(subtree, ex)
+        return subtree, (walker.dir_count, walker.file_count, walker.link_count), walker._errors
+
+    def _finish_subtree(self, folder: IOFolder):
+        """
+        Finish the items below `folder` that were walked elsewhere, in the order a
+        local depth-first walk finishes them. Sizes and depths are computed again
+        on the way, as the walk would have.
+        """
+        cursor: list = [[folder, 0]]
+        while len(cursor) > 0:
+            parent, i = cursor[-1]
+            if i == len(parent.children):
+                cursor.pop()
+                self._sort_children(parent)
+                if len(cursor) > 0:
+                    self._maybe_spill(parent)
+                    self._finish_item(cursor[-1][0], parent)
+                continue
+            cursor[-1][1] += 1
+            current: IOItem = parent.children[i]
+            current.depth = 0
+            if parent.depth == 0:
+                parent.depth = 1
+            if current.kind == IOKind.DIR:
+                current.size = 0
+                current._fingerprint = None
+                self._adjust_depth(parent, current)
+                cursor.append([current, 0])
+                continue
+            self._finish_item(parent, current)
+
+    def _walk_from(self, folder: IOFolder) -> IOFolder:
+        if self._journal is not None:
+            entries: list = self._journal.lookup(folder.full_path)
+            if entries is not None:
+                return self._walk_entries(folder, entries, None, True)
+        if self._use_fd_walk():
+            try:
+                fd: int = self._call_timed(folder, os.open, folder.full_path, os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0), cleanup=os.close)
+            except OSError as ex:
+                self._onError(folder, ex)
+                return folder
+            try:
+                return self._walk_fd(folder, fd)
+            finally:
+                os.close(fd)
+        return self._walk_path(folder)
+
+    def _scan_path(self, root_path: str, budget: int = None) -> list:
+        entries: list = []
+        for path in os.listdir(root_path):
+            if budget is not None and len(entries) >= budget:
+                break
+            if self._is_excluded(path):
+                continue
+            abs_path: str = os.path.join(root_path, path)
+            try:
+                st: os.stat_result = os.lstat(abs_path)
+            except OSError as ex:
+                entries.append((path, IOKind.FILE, ex))
+                continue
+            if stat.S_ISLNK(st.st_mode) and self.options.follow_links is not None:
+                # Only links to directories are followed, like --fd-walk does
+                try:
+                    target: os.stat_result = os.stat(abs_path)
+                    if stat.S_ISDIR(target.st_mode):
+                        st = target
+                except OSError:
+                    pass
+            if stat.S_ISDIR(st.st_mode):
+                entries.append((path, IOKind.DIR, st))
+            elif stat.S_ISLNK(st.st_mode):
+                entries.append((path, IOKind.LINK, st))
+            else:
+                entries.append((path, IOKind.FILE, st))
+        return entries
+
+    def _scan_fd_dup(self, dir_fd: int, budget: int = None) -> list:
+        # Listing threads may outlive the walk of `dir_fd`, so they list their own copy
+        fd: int = os.dup(dir_fd)
+        try:
+            return self._scan_fd(fd, budget)
+        finally:
+            os.close(fd)
+
+    def _scan_fd(self, dir_fd: int, budget: int = None) -> list:
+        """
+        List `dir_fd`, stopping after `budget` entries when given (--limit).
+        """
+        entries: list = []
+        with os.scandir(dir_fd) as it:
+            for entry in it:
+                if budget is not None and len(entries) >= budget:
+                    break
+                if self._is_excluded(entry.name):
+                    continue
+                kind: IOKind = IOKind.FILE
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        kind = IOKind.DIR
+                        entries.append((entry.name, kind, entry.stat(follow_symlinks=False) if self._need_dir_stat() else None))
+                    elif entry.is_symlink():
+                        if self.options.follow_links is not None and entry.is_dir(follow_symlinks=True):
+                            entries.append((entry.name, IOKind.DIR, entry.stat(follow_symlinks=True)))
+                        else:
+                            entries.append((entry.name, IOKind.LINK, entry.stat(follow_symlinks=False)))
+                    else:
+                        entries.append((entry.name, kind, entry.stat(follow_symlinks=False)))
+                except OSError as ex:
+                    entries.append((entry.name, kind, ex))
+        return entries
+
+    def _walk_entries(self, root: IOFolder, entries: list, dir_fd: int = None, replayed: bool = False) -> IOFolder:
+        """
+        Build the items of `root` from its listing: (name, kind, stat) tuples.
+        Sub-directories are opened relative to `dir_fd` when given, by path otherwise.
+        An entry whose stat failed carries the OSError in place of its stat.
+        """
+        for name, kind, st in entries:
+            if self._limit_reached():
+                break
+            if root.depth == 0:
+                root.depth = 1
+            error: OSError = None
+            if isinstance(st, OSError):
+                error = st
+                st = None
+            current: IOItem = self._new_item(root, name, kind, st)
+            if error is not None:
+                self._onError(current, error)
+            elif kind == IOKind.DIR:
+                self._adjust_depth(root, current)
+                if self._can_descend(current, st):
+                    if replayed:
+                        current = self._walk_from(current)
+                    elif dir_fd is None:
+                        current = self._walk_path(current)
+                    else:
+                        flags: int = _O_DIRFLAGS
+                        if self.options.follow_links is not None:
+                            flags &= ~getattr(os, 'O_NOFOLLOW', 0)
+                        fd: int = None
+                        try:
+                            fd = self._call_timed(current, os.open, name, flags, dir_fd=dir_fd, cleanup=os.close)
+                        except OSError as ex:
+                            self._onError(current, ex)
+                        if fd is not None:
+                            try:
+                                current = self._walk_fd(current, fd)
+                            finally:
+                                os.close(fd)
+                    self._maybe_spill(current)
+            self._add_item(root, current)
+        self._sort_children(root)
+        return root
+
+    def _new_item(self, root: IOFolder, name: str, kind: IOKind, st: os.stat_result) -> IOItem:
+        current: IOItem = None
+        if kind == IOKind.DIR:
+            current = IOFolder(name, None, 0, root)
+            self._dir_count += 1
+        elif kind == IOKind.LINK:
+            current = IOLink(name, None, 0, root)
+            self._link_count += 1
+        else:
+            current = IOFile(name, None, 0, root, st.st_size if st is not None else 0)
+            self._file_count += 1
+        current.tag = self
+        if st is not None:
+            current.set_stat(st)
+        return current
+
+    def _scan_folder(self, folder: IOFolder) -> list:
+        """
+        List `folder` by path and journal the listing. Returns None if it failed.
+        """
+        self._check_stop()
+        self._print_walking(folder)
+        budget: int = self._budget()
+        try:
+            entries: list = self._call_timed(folder, self._scan_path, folder.full_path, budget)
+        except OSError as ex:
+            self._onError(folder, ex)
+            return None
+        self._record_listing(folder, entries, budget)
+        return entries
+
+    def _record_listing(self, folder: IOFolder, entries: list, budget: int):
+        # A listing cut short by --limit would be replayed as the whole folder
+        if self._journal is not None and (budget is None or len(entries) < budget):
+            self._journal.record(folder.full_path, entries)
+
+    def _walk_path(self, root : IOFolder) -> IOFolder:
+        entries: list = self._scan_folder(root)
+        if entries is None:
+            return root
+        return self._walk_entries(root, entries)
+
+    def _walk_bfs(self, root: IOFolder) -> IOFolder:
+        """
+        Walk `root` level by level. Directories wait in a frontier of at most
+        BFS_FRONTIER folders; once it is full, further directories are left to be
+        walked depth-first, so memory stays bounded on very wide trees.
+        Only the listing order changes: listed items are finished by a cursor
+        that goes through the tree depth-first and waits at folders that are not
+        listed yet, so sizes, depths and sinks see exactly what a depth-first
+        walk produces.
+        """
+        import collections
+        frontier: collections.deque = collections.deque([root])
+        waiting: set = set()
+        queued: set = set()
+        deferred: set = set()
+        failed: set = set()
+        cursor: list = [[root, 0]]
+        while len(frontier) > 0:
+            folder: IOFolder = frontier.popleft()
+            waiting.discard(folder)
+            entries: list = None
+            if not self._limit_reached():
+                if self._journal is not None:
+                    entries = self._journal.lookup(folder.full_path)
+                if entries is None:
+                    entries = self._scan_opened_folder(folder) if self._use_fd_walk() else self._scan_folder(folder)
+            for name, kind, st in entries if entries is not None else []:
+                if self._limit_reached():
+                    break
+                error: OSError = None
+                if isinstance(st, OSError):
+                    error = st
+                    st = None
+                current: IOItem = self._new_item(folder, name, kind, st)
+                folder.children.append(current)
+                if error is not None:
+                    self._onError(current, error)
+                    failed.add(current)
+                elif kind == IOKind.DIR and self._can_descend(current, st):
+                    if len(frontier) < Command.BFS_FRONTIER:
+                        frontier.append(current)
+                        waiting.add(current)
+                        queued.add(current)
+                    else:
+                        deferred.add(current)
+            self._finish_listed(cursor, waiting, queued, deferred, failed)
+        return root
+
+    def _finish_listed(self, cursor: list, waiting: set, queued: set, deferred: set, failed: set):
+        """
+        Move the depth-first cursor of a BFS walk as far as the listed folders allow.
+        """
+        while len(cursor) > 0:
+            folder, i = cursor[-1]
+            if folder in waiting:
+                return
+            if i == len(folder.children):
+                cursor.pop()
+                queued.discard(folder)
+                self._sort_children(folder)
+                if len(cursor) > 0:
+                    self._maybe_spill(folder)
+                    self._finish_item(cursor[-1][0], folder)
+                continue
+            cursor[-1][1] += 1
+            current: IOItem = folder.children[i]
+            if folder.depth == 0:
+                folder.depth = 1
+            if current.kind == IOKind.DIR and current not in failed:
+                self._adjust_depth(folder, current)
+                if current in deferred:
+                    deferred.discard(current)
+                    self._walk_from(current)
+                    self._maybe_spill(current)
+                elif current in queued:
+                    cursor.append([current, 0])
+                    continue
+            failed.discard(current)
+            self._finish_item(folder, current)
+
+    def _walk_fd(self, root : IOFolder, dir_fd: int) -> IOFolder:
+        """
+        Walk `root` through its open directory descriptor (in the style of os.fwalk).
+        Entries are listed and stat'ed relative to `dir_fd`, so the kernel never
+        resolves the full path again and no path strings are built while walking.
+        """
+        entries: list = self._scan_fd_folder(root, dir_fd)
+        if entries is None:
+            return root
+        return self._walk_entries(root, entries, dir_fd)
+
+    def _scan_opened_folder(self, folder: IOFolder) -> list:
+        """
+        List `folder` through a descriptor opened by its path, for walks that do
+        not keep the descriptors of parent folders open (BFS, the coordinator).
+        Returns None if it failed.
+        """
+        try:
+            fd: int = self._call_timed(folder, os.open, folder.full_path, os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0), cleanup=os.close)
+        except OSError as ex:
+            self._onError(folder, ex)
+            return None
+        try:
+            return self._scan_fd_folder(folder, fd)
+        finally:
+            os.close(fd)
+
+    def _scan_fd_folder(self, folder: IOFolder, dir_fd: int) -> list:
+        """
+        List `folder` through its open descriptor and journal the listing. Returns None if it failed.
+        """
+        self._check_stop()
+        self._print_walking(folder)
+        budget: int = self._budget()
+        try:
+            if self._listing_slots is None:
+                entries: list = self._scan_fd(dir_fd, budget)
+            else:
+                entries: list = self._call_timed(folder, self._scan_fd_dup, dir_fd, budget)
+        except OSError as ex:
+            self._onError(folder, ex)
+            return None
+        self._record_listing(folder, entries, budget)
+        return entries
+
+    def parse_args(self, options) -> bool:
+        parser: optparse.OptionParser = optparse.OptionParser(f'%prog {self._name} [options]')
+        self._onAddOptions(parser)
+
+        try:
+            opts, args = parser.parse_args(options)
+            self._options = opts
+            self._excludes = None
+        except Exception as ex:
+            print(ex)
+            parser.print_help()
+            return False
+        self._onOptionsParsed()
         return True   
     
-    def execute(self, dir: str = None) -> bool:
+    def accepts(self, path: str) -> bool:
+        return os.path.isdir(path)
+
+    def _reaches(self, outer: str, inner: str) -> bool:
+        """
+        Whether walking the real path `outer` lists everything under the real
+        path `inner`: the walk must be recursive without --max-depth, and no
+        folder on the way may be excluded or, with --one-file-system, mounted.
+        """
+        if outer == inner:
+            return True
+        if os.path.commonpath([outer, inner]) != outer:
+            return False
+        if self.options.recursive is None or getattr(self.options, 'max_depth', None) is not None:
+            return False
+        names: list = os.path.relpath(inner, outer).split(os.sep)
+        if any([self._is_excluded(name) for name in names]):
+            return False
+        if self.options.one_file_system is not None:
+            try:
+                dev: int = os.stat(outer).st_dev
+                path: str = outer
+                for name in names:
+                    path = os.path.join(path, name)
+                    if os.stat(path).st_dev != dev:
+                        return False
+            except OSError:
+                return False
+        return True
+
+    def _collapse_roots(self, dirs: list) -> list:
+        """
+        Drop duplicated roots and roots nested inside another root that the walk
+        of that root reaches, keeping the order in which they were given.
+        """
+        roots: list = []
+        reals: list = []
+        for d in dirs:
+            real: str = os.path.realpath(d)
+            covered: bool = False
+            for i in range(len(reals)):
+                if reals[i] is None:
+                    continue
+                if self._reaches(reals[i], real):
+                    covered = True
+                    break
+                if self._reaches(real, reals[i]):
+                    print(f'{roots[i]} is inside {d}, walking {d} only')
+                    reals[i] = None
+            if covered:
+                print(f'{d} is inside another directory, skipped')
+                continue
+            roots.append(d)
+            reals.append(real)
+        return [roots[i] for i in range(len(roots)) if reals[i] is not None]
+
+    def execute(self, dir = None) -> bool:
         if isinstance(dir, str):
-            _path, _name = os.path.split(dir)
-            self._dir = IOFolder(_name, _path)
+            dir = [dir]
+        if isinstance(dir, list):
+            self._dirs = []
+            for d in self._collapse_roots(dir):
+                _path, _name = os.path.split(d)
+                self._dirs.append(IOFolder(_name, _path))
+            self._dir = self._dirs[0] if len(self._dirs) > 0 else None
         if not self._preExecute():
             self._postExecute()
             return False
@@ -717,18 +3008,134 @@ class Command:
             return False
         return True
 
+    def _open_journal(self):
+        import signal
+        if self.options.checkpoint is None:
+            if self.options.resume is not None:
+                raise ValueError('--resume requires --checkpoint')
+            return
+        header: dict = {
+            'roots': [d.full_path for d in self.directories],
+            'exclude': self.options.exclude,
+            'recursive': self.options.recursive is not None,
+            'follow_links': self.options.follow_links is not None,
+            'one_file_system': self.options.one_file_system is not None,
+        }
+        self._journal = IOJournal(self.options.checkpoint, header, self.options.resume is not None, self.options.checkpoint_interval)
+        if self._journal.replayable > 0:
+            print(f'Resuming from {self._journal.file}: {self._journal.replayable} directories already walked')
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self._onTerminate)
+
+    def _close_journal(self, completed: bool):
+        import signal
+        if self._journal is None:
+            return
+        self._journal.close(completed)
+        if not completed:
+            print(f'\nWalk state is saved to {self._journal.file}, run again with --resume to continue')
+        self._journal = None
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    def _onTerminate(self, signum, frame):
+        # Unwind the walk so that the journal is flushed on the way out; the
+        # walkers of other roots stop at their next directory
+        self._stop.set()
+        sys.exit(128 + signum)
+
+    def _check_stop(self):
+        if self._stop.is_set():
+            raise InterruptedError('Walk is interrupted')
+
     def _onExecute(self) -> bool:
+        completed: bool = False
+        started: float = time.monotonic()
+        self._top_dirs = [] if self.options.metrics_file is not None else None
+        self._item_stat = self._wants_item_stat()
+        self._stop.clear()
         try:
             self._dir_count = 0
             self._file_count = 0
             self._link_count = 0
-            self._dir = self._walk(self.directory)
+            self._node_count = 0
+            self._errors = {}
+            if self.options.dir_timeout is not None:
+                self._listing_slots = threading.BoundedSemaphore(max(1, self.options.max_listings))
+            roots: list = self.directories
+            if self._coordinator_address() is not None and (len(roots) > 1 or self.options.limit is not None or self.options.checkpoint is not None):
+                raise ValueError('--coordinator walks a single directory, without --limit or --checkpoint')
+            self._open_journal()
+            if len(roots) == 1:
+                self._dir = self._walk(self.directory)
+                self._dirs[0] = self._dir
+            else:
+                self._walk_roots(roots)
+            completed = True
+            walkers: list = self._walkers if len(self._walkers) > 0 else [self]
+            if self.options.limit is not None and any([w._limit_reached() for w in walkers]):
+                print(f'\nStopped after {self.options.limit} entries (--limit)')
+            self._print_errors()
+            if self.options.save_snapshot is not None:
+                IOSnapshot(self.options.save_snapshot).save(self.directories, self.name, (self._dir_count, self._file_count, self._link_count), self._walk_options())
+                print(f'\nSnapshot is saved to {self.options.save_snapshot}')
         except Exception as ex:
             print(ex)
             return False
+        finally:
+            self._close_journal(completed)
+            self._save_metrics(completed, started)
         return True
     
+    def _new_walker(self):
+        walker: Command = copy.copy(self)
+        walker._dir_count = 0
+        walker._file_count = 0
+        walker._link_count = 0
+        walker._node_count = 0
+        walker._errors = {}
+        walker._top_dirs = [] if self._top_dirs is not None else None
+        walker._visited = {}
+        walker._spill_store = None
+        walker._walkers = []
+        return walker
+
+    def _walk_roots(self, roots: list):
+        """
+        Walk several roots over one shared thread pool. Every root is walked by
+        its own copy of the command so that counters and walk state are not
+        shared between threads; the counters are summed afterwards.
+        """
+        import concurrent.futures
+        self._walkers = [self._new_walker() for r in roots]
+        pool: concurrent.futures.ThreadPoolExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=self.options.jobs)
+        try:
+            futures: list = [pool.submit(w._walk, r) for w, r in zip(self._walkers, roots)]
+            for i in range(len(futures)):
+                roots[i] = futures[i].result()
+        except BaseException:
+            # Interrupted (SIGTERM) or failed: roots not started yet are dropped
+            # and the walkers still running stop at their next directory
+            self._stop.set()
+            raise
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+        for w in self._walkers:
+            self._dir_count += w.dir_count
+            self._file_count += w.file_count
+            self._link_count += w.link_count
+            self._node_count += w._node_count
+            for key, count in w._errors.items():
+                self._errors[key] = self._errors.get(key, 0) + count
+        self._dirs = roots
+        self._dir = roots[0]
+
     def _postExecute(self):
+        for w in self._walkers + [self]:
+            if w._spill_store is not None:
+                w._spill_store.close()
+                w._spill_store = None
+        self._walkers = []
         print()
         print('='*50)
         if self._status:
@@ -737,19 +3144,13 @@ class Command:
             print(f'Command {self._name} is finished (fail)')
 
 class PrintCommand(Command):
-    def __init__(self, dir: str = '') -> None:
-        super().__init__('print', 'Print directory content', dir)
+    def __init__(self, dir: str = '', name: str = 'print', desc: str = 'Print directory content') -> None:
+        super().__init__(name, desc, dir)
         self._fields_size: dict = {}
         self._fields_size[S_Sharp] = 0
-        self._fields_size[S_Name] = 0
-        self._fields_size[S_Path] = 0
-        self._fields_size[S_Fullpath] = 0
-        self._fields_size[S_Type] = 0
-        self._fields_size[S_Size] = 0
-        self._fields_size[S_Extension] = 0
-        self._fields_size[S_Command] = 0
-        self._fields_size[S_Result] = 0
-        self._fields_size[S_Remark] = 0
+        for name in FIELDS:
+            self._fields_size[name] = 0
+        self._xls_formats: dict = {}
     
     def _onAddOptions(self, parser: optparse.OptionParser):
         super()._onAddOptions(parser)
@@ -762,372 +3163,858 @@ class PrintCommand(Command):
         parser.add_option('-u', '--print-result', action='store_false', help='Print command result')
         parser.add_option('-a', '--print-parent', action='store_false', help='Print parent item name before the item\'s name')
         parser.add_option('-m', '--print-remark', action='store_false', help='Print remark information')
+        parser.add_option('--print-mtime', action='store_false', help='Print item modification time')
+        parser.add_option('--print-mode', action='store_false', help='Print item permission bits')
+        parser.add_option('--print-owner', action='store_false', help='Print item owner')
+        parser.add_option('--print-inode', action='store_false', help='Print item inode number')
+        parser.add_option('--pipeline', type='int', help='Export streamed rows (.csv/.jsonl/.sqlite) on a separate thread while walking, with at most N items queued between them')
 
     def _onExecute(self) -> bool:
-        if not super()._onExecute():
+        if IOStreamExporter.format(self.options.output) is None:
+            if not super()._onExecute():
+                return False
+            return self._export()
+        # Stream rows while walking; folders are written once their subtree is done
+        try:
+            self._sink = IOStreamExporter.create(self.options.output, self._fields())
+            if self.options.pipeline is not None:
+                self._sink = IOPipeline(self._sink, self.options.pipeline)
+            self._release_tree = self.options.save_snapshot is None
+            if not super()._onExecute():
+                return False
+            for root in self.directories:
+                self._sink.write(root)
+            sink, self._sink = self._sink, None
+            sink.close()
+            print(f'\n{sink.count} rows are written to {self.options.output}')
+        except Exception as ex:
+            print(ex)
             return False
+        finally:
+            if self._sink is not None:
+                try:
+                    self._sink.close()
+                except Exception as ex:
+                    print(ex)
+                self._sink = None
+        return True
 
-        fields: list =[]
-        if self.options.print_name is not None:
-            fields.append(S_Name)
-        if self.options.print_path is not None:
-            fields.append(S_Path)
-            fields.append(S_Fullpath)
-        if self.options.print_type is not None:
-            fields.append(S_Type)
-        if self.options.print_size is not None:
-            fields.append(S_Size)
-        if self.options.print_ext is not None:
-            fields.append(S_Extension)
-        if self.options.print_command is not None:
-            fields.append(S_Command)
-        if self.options.print_result is not None:
-            fields.append(S_Result)
-        if self.options.print_remark is not None:
-            fields.append(S_Remark)
-        
+    def _exportStream(self, fields: tuple):
+        exporter: IOStreamExporter = IOStreamExporter.create(self.options.output, fields)
         try:
-            if self.options.output is None:
+            for root in self.directories:
+                # Same order as a streamed walk: children before their folder
+                stack: list = [(root, False)]
+                while len(stack) > 0:
+                    item, done = stack.pop()
+                    if done or item.kind != IOKind.DIR:
+                        exporter.write(item)
+                        continue
+                    stack.append((item, True))
+                    stack.extend([(child, False) for child in reversed(item.children)])
+        finally:
+            exporter.close()
+
+    def _fields(self) -> tuple:
+        """
+        Returns the selected report columns, in report order, as IOField objects.
+        """
+        selected: dict = {
+            S_Name: self.options.print_name,
+            S_Path: self.options.print_path,
+            S_Fullpath: self.options.print_path,
+            S_Type: self.options.print_type,
+            S_Size: self.options.print_size,
+            S_Extension: self.options.print_ext,
+            S_Mtime: self.options.print_mtime,
+            S_Mode: self.options.print_mode,
+            S_Owner: self.options.print_owner,
+            S_Inode: self.options.print_inode,
+            S_Command: self.options.print_command,
+            S_Result: self.options.print_result,
+            S_Remark: self.options.print_remark,
+        }
+        return tuple([field for name, field in FIELDS.items() if selected[name] is not None])
+
+    def _wants_item_stat(self) -> bool:
+        if super()._wants_item_stat():
+            return True
+        format: str = IOStreamExporter.format(self.options.output)
+        fields: tuple = self._fields()
+        if format == 'sqlite' or (len(fields) == 0 and format is not None):
+            # SQLite keeps the mtime of every item, the other exporters write every field when none is selected
+            return True
+        return any([field.name in (S_Mtime, S_Mode, S_Owner, S_Inode) for field in fields])
+
+    def _export(self) -> bool:
+        fields: tuple = self._fields()
+        self._xls_formats = {}
+        try:
+            if IOStreamExporter.format(self.options.output) is not None:
+                self._exportStream(fields)
+            elif self.options.output is None:
                 #Print to console
                 print()
-                self._printDirectory(self.directory, self.directory.depth, ' ', fields, False)
-                self._printDirectory(self.directory, self.directory.depth, ' ', fields, True)
+                for root in self.directories:
+                    self._printDirectory(root, root.depth, ' ', fields, False)
+                for root in self.directories:
+                    self._printDirectory(root, root.depth, ' ', fields, True)
             else:
-                #Write to output file
-                row: int = 0
-                col: int = 0
-                
-                _wb: xlsxwriter.Workbook = xlsxwriter.Workbook(self.options.output)
-                _ws: xlsxwriter.worksheet.Worksheet = _wb.add_worksheet(self.directory.name)
-                
-                hdr_fmt = XlsHeaderFormat(_wb.add_format())
-                file_fmt = XlsCellFormat(_wb.add_format())
-                file_fmt.border.top.style = XlsBorderStyle.CONTINUOUS
-                file_fmt.border.left.style = XlsBorderStyle.CONTINUOUS
-                dir_fmt = XlsCellFormat(_wb.add_format())
-                dir_fmt.font.bold = True
-                dir_fmt.border.top.style = XlsBorderStyle.CONTINUOUS
-                dir_fmt.border.left.style = XlsBorderStyle.CONTINUOUS
-                dir_fmt.fill.style = XlsFillStyle.SOLID
-                dir_fmt.fill.color = '#EEEEEE'
-                fmt = hdr_fmt.build()
-                #Write header cells
-                _ws.write(row, col, S_Root, fmt)
-                for j in range(1, self.directory.depth + 1):
-                    _ws.write(row, col + j, 'Sub-item level {}'.format(j), fmt)
-                additional_col: int = self.directory.depth
-                if S_Name in fields:
-                    additional_col += 1
-                    _ws.write(row, col + additional_col, S_Name, fmt)
-                if S_Path in fields:
-                    additional_col += 1
-                    _ws.write(row, col + additional_col, S_Path, fmt)
-                if S_Fullpath in fields:
-                    additional_col += 1
-                    _ws.write(row, col + additional_col, S_Fullpath, fmt)
-                if S_Type in fields:
-                    additional_col += 1
-                    _ws.write(row, col + additional_col,S_Type, fmt)
-                if S_Size in fields:
-                    additional_col += 1
-                    _ws.write(row, col + additional_col, S_Size, fmt)
-                if S_Extension in fields:
-                    additional_col += 1
-                    _ws.write(row, col + additional_col, S_Extension, fmt)
-                if S_Command in fields:
-                    additional_col += 1
-                    _ws.write(row, col + additional_col, S_Command, fmt)
-                if S_Result in fields:
-                    additional_col += 1
-                    _ws.write(row, col + additional_col, S_Result, fmt)
-                if S_Remark in fields:
-                    additional_col += 1
-                    _ws.write(row, col + additional_col, S_Remark, fmt)
-
-                row += 1
-                _ws.write(row, col, S_Name, fmt)
-                for j in range(1, self.directory.depth + 1):
-                    _ws.write(row, col + j, S_Name, fmt)
-                additional_col: int = self.directory.depth
-                if S_Name in fields:
-                    additional_col += 1
-                    _ws.merge_range(row - 1, col + additional_col, row, col + additional_col, S_Name, fmt)
-                if S_Path in fields:
-                    additional_col += 1
-                    _ws.merge_range(row - 1, col + additional_col, row, col + additional_col, S_Path, fmt)
-                if S_Fullpath in fields:
-                    additional_col += 1
-                    _ws.merge_range(row - 1, col + additional_col, row, col + additional_col, S_Fullpath, fmt)
-                if S_Type in fields:
-                    additional_col += 1
-                    _ws.merge_range(row - 1, col + additional_col, row, col + additional_col, S_Type, fmt)
-                if S_Size in fields:
-                    additional_col += 1
-                    _ws.merge_range(row - 1, col + additional_col, row, col + additional_col, S_Size, fmt)
-                if S_Extension in fields:
-                    additional_col += 1
-                    _ws.merge_range(row - 1, col + additional_col, row, col + additional_col, S_Extension, fmt)
-                
-                if S_Command in fields:
-                    additional_col += 1
-                    _ws.merge_range(row - 1, col + additional_col, row, col + additional_col, S_Command, fmt)
-                
-                if S_Result in fields:
-                    additional_col += 1
-                    _ws.merge_range(row - 1, col + additional_col, row, col + additional_col, S_Result, fmt)
-
-                if S_Remark in fields:
-                    additional_col += 1
-                    _ws.merge_range(row - 1, col + additional_col, row, col + additional_col, S_Remark, fmt)
-                
-                logparent: bool = False
-                if self.options.print_parent is not None:
-                    logparent = True
-                progress: int = 0
-                last_row = self._writeOutput(self.directory, _wb, _ws, row + 1, col, self.directory.depth, file_fmt, dir_fmt, fields, logparent, progress) + 1
-                footer_fmt = XlsCellFormat(_wb.add_format())
-                footer_fmt.border.top.style = XlsBorderStyle.CONTINUOUS
-                additional_col += 1
-                for c in range(col, col + additional_col):
-                    _ws.write_blank(last_row, c, None, footer_fmt.build())
-                footer_fmt.border.top.style = XlsBorderStyle.NONE
-                footer_fmt.border.left.style = XlsBorderStyle.CONTINUOUS
-                for r in range(row, last_row):
-                    _ws.write_blank(r, col + additional_col, None, footer_fmt.build(_wb.add_format()))
-
+                #Write to output file, one sheet per root directory
+                _wb: xlsxwriter.Workbook = _open_workbook(self.options.output, True)
+                for root in self.directories:
+                    self._writeSheet(_wb, root, fields)
                 _wb.close()
         except Exception as ex:
             print(ex)
             return False
         return True
     
-    def _writeOutput(self, item: IOItem, _wb: xlsxwriter.Workbook, _ws: xlsxwriter.worksheet.Worksheet, row: int, col: int, root_depth: int, fmt_file: XlsCellFormat = None, fmt_dir: XlsCellFormat = None, fields: list = [], logparent: bool = False, progress: int = None) -> int:
-        if self.options.verbose is not None:
-            print(f'Printing {item.full_path}')
-        else:
-            line: str = f'Printing {self._shorten_path(item.full_path, 128)}'
-            print(f'\r{line}{" "*(140-len(line))}', end='\r')
+    def _sheet_name(self, _wb: xlsxwriter.Workbook, name: str) -> str:
+        name = re.sub(r'[\[\]:*?/\\]', '_', name)[:31]
+        if len(name) == 0:
+            name = S_Root
+        used: list = [ws.get_name().lower() for ws in _wb.worksheets()]
+        new_name: str = name
+        i: int = 1
+        while new_name.lower() in used:
+            suffix: str = f' ({i})'
+            new_name = name[:31-len(suffix)] + suffix
+            i += 1
+        return new_name
+
+    def _writeSheet(self, _wb: xlsxwriter.Workbook, root: IOFolder, fields: tuple):
+        row: int = 0
+        col: int = 0
+        
+        _ws: xlsxwriter.worksheet.Worksheet = _wb.add_worksheet(self._sheet_name(_wb, root.name))
+        
+        hdr_fmt = XlsHeaderFormat(_wb.add_format())
+        file_fmt = XlsCellFormat(_wb.add_format())
+        file_fmt.border.top.style = XlsBorderStyle.CONTINUOUS
+        file_fmt.border.left.style = XlsBorderStyle.CONTINUOUS
+        dir_fmt = XlsCellFormat(_wb.add_format())
+        dir_fmt.font.bold = True
+        dir_fmt.border.top.style = XlsBorderStyle.CONTINUOUS
+        dir_fmt.border.left.style = XlsBorderStyle.CONTINUOUS
+        dir_fmt.fill.style = XlsFillStyle.SOLID
+        dir_fmt.fill.color = '#EEEEEE'
+        fmt = hdr_fmt.build()
+        #Write header cells
+        _ws.write(row, col, S_Root, fmt)
+        for j in range(1, root.depth + 1):
+            _ws.write(row, col + j, 'Sub-item level {}'.format(j), fmt)
+        # Field headers span both header rows. Rows are flushed one after the
+        # other (constant_memory), where only one range per row can be merged,
+        # so the border between the two cells is left out instead
+        upper_fmt = hdr_fmt.clone()
+        upper_fmt.border.bottom.style = XlsBorderStyle.NONE
+        upper = upper_fmt.build(_wb.add_format())
+        lower_fmt = hdr_fmt.clone()
+        lower_fmt.border.top.style = XlsBorderStyle.NONE
+        lower = lower_fmt.build(_wb.add_format())
+        additional_col: int = root.depth
+        for field in fields:
+            additional_col += 1
+            _ws.write(row, col + additional_col, field.name, upper)
+
+        row += 1
+        _ws.write(row, col, S_Name, fmt)
+        for j in range(1, root.depth + 1):
+            _ws.write(row, col + j, S_Name, fmt)
+        for c in range(root.depth + 1, additional_col + 1):
+            _ws.write_blank(row, col + c, None, lower)
+        
+        logparent: bool = False
+        if self.options.print_parent is not None:
+            logparent = True
+        footer_fmt = XlsCellFormat(_wb.add_format())
+        footer_fmt.border.top.style = XlsBorderStyle.CONTINUOUS
+        footer = footer_fmt.build()
+        footer_fmt.border.top.style = XlsBorderStyle.NONE
+        footer_fmt.border.left.style = XlsBorderStyle.CONTINUOUS
+        side_fmt = footer_fmt.build(_wb.add_format())
+        additional_col += 1
+        # The right edge runs along every row below the first header row
+        side: list = [(col + additional_col, None, side_fmt)]
+        _ws.write_blank(row, col + additional_col, None, side_fmt)
+        last_row = self._writeOutput(root, _wb, _ws, row + 1, col, root.depth, file_fmt, dir_fmt, fields, logparent, side) + 1
+        for c in range(col, col + additional_col):
+            _ws.write_blank(last_row, c, None, footer)
+
+    def _derivedFormat(self, _wb: xlsxwriter.Workbook, fmt: XlsCellFormat, continuation: bool) -> xlsxwriter.format.Format:
+        """
+        Formats of the blank cells around an item, built once per workbook:
+        `continuation` is the left edge below a folder, otherwise the cells
+        between an item's name and its fields.
+        """
+        key: tuple = (id(fmt), continuation)
+        built: xlsxwriter.format.Format = self._xls_formats.get(key)
+        if built is None:
+            new_fmt = fmt.clone()
+            new_fmt.border.right.style = XlsBorderStyle.NONE
+            if continuation:
+                new_fmt.border.left.style = XlsBorderStyle.CONTINUOUS
+                new_fmt.border.top.style = XlsBorderStyle.NONE
+                new_fmt.border.bottom.style = XlsBorderStyle.NONE
+            else:
+                new_fmt.border.left.style = XlsBorderStyle.NONE
+            built = new_fmt.build(_wb.add_format())
+            self._xls_formats[key] = built
+        return built
+
+    def _writeOutput(self, item: IOItem, _wb: xlsxwriter.Workbook, _ws: xlsxwriter.worksheet.Worksheet, row: int, col: int, root_depth: int, fmt_file: XlsCellFormat = None, fmt_dir: XlsCellFormat = None, fields: tuple = (), logparent: bool = False, edges: list = ()) -> int:
+        """
+        Write `item` and its subtree from `row` on, strictly in row order (the
+        workbook is in constant_memory mode). `edges` holds the (column, name,
+        format) of the edge cells that the folders above `item` draw on each of
+        their rows. Returns the last row written.
+        """
+        self._print_progress('Printing', item, 140)
         fmt: XlsCellFormat = None
         if item.kind == IOKind.DIR:
             if fmt_dir is not None:
                 fmt = fmt_dir
         else:
             fmt = fmt_file
-        _ws.write(row, col + root_depth - item.depth, item.name, fmt.build())
-        additional_col: int = root_depth
-        if S_Name in fields:
-            additional_col += 1
-            _ws.write(row, col + additional_col, item.name, fmt.build())
-        if S_Path in fields:
-            additional_col += 1
-            _ws.write(row, col + additional_col, item.path, fmt.build())
-        if S_Fullpath in fields:
-            additional_col += 1
-            _ws.write(row, col + additional_col, item.full_path, fmt.build())
-        if S_Type in fields:
-            additional_col += 1
-            _ws.write(row, col + additional_col, item.kind.name, fmt.build())
-        if S_Size in fields:
-            additional_col += 1
-            _ws.write(row, col + additional_col, item.size, fmt.build())
-        if S_Extension in fields:
-            additional_col += 1
-            _ws.write(row, col + additional_col, item.extension, fmt.build())
-        
-        if S_Command in fields:
-            additional_col += 1
-            if item.tag is not None:
-                _ws.write(row, col + additional_col, item.tag.name, fmt.build())
-            else:
-                _ws.write(row, col + additional_col, S_Empty, fmt.build())
-        
-        item.status = True
-        if isinstance(progress, int):
-            progress += 1
-        if S_Result in fields:
-            additional_col += 1
-            if item.tag is not None:
-                if item.status:
-                    _ws.write(row, col + additional_col, S_Success, fmt.build())
-                else:
-                    _ws.write(row, col + additional_col, S_Failed, fmt.build())
+        cell_fmt = fmt.build()
+        for edge_col, name, edge_fmt in edges:
+            if name is None:
+                _ws.write_blank(row, edge_col, None, edge_fmt)
             else:
-                _ws.write(row, col + additional_col, S_Empty, fmt.build())
-        
-        if S_Remark in fields:
+                _ws.write(row, edge_col, name, edge_fmt)
+        _ws.write(row, col + root_depth - item.depth, item.name, cell_fmt)
+        item.status = not item.failed
+        additional_col: int = root_depth
+        for field in fields:
             additional_col += 1
-            _ws.write(row, col + additional_col, S_Remark, fmt.build())
+            _ws.write(row, col + additional_col, field.value(item), cell_fmt)
         
-        first_row: int = row
         if item.depth > 0:
-            new_fmt = fmt.clone()
-            new_fmt.border.left.style = XlsBorderStyle.NONE
-            new_fmt.border.right.style = XlsBorderStyle.NONE
+            blank_fmt = self._derivedFormat(_wb, fmt, False)
             for c in range(1, item.depth + 1):
-                _ws.write_blank(row, col + root_depth - item.depth + c,  None, new_fmt.build(_wb.add_format()))
+                _ws.write_blank(row, col + root_depth - item.depth + c,  None, blank_fmt)
 
-        for child in item.children:
-            row = self._writeOutput(child, _wb, _ws, row + 1, col, root_depth, fmt_file, fmt_dir, fields, logparent, progress)
-        if first_row < row:
-            new_fmt = fmt.clone()
-            new_fmt.border.left.style = XlsBorderStyle.CONTINUOUS
-            new_fmt.border.right.style = XlsBorderStyle.NONE
-            new_fmt.border.top.style = XlsBorderStyle.NONE
-            new_fmt.border.bottom.style = XlsBorderStyle.NONE
-            for r in range(first_row + 1, row + 1):
-                if logparent:
-                    _ws.write(r, col + root_depth - item.depth, item.name, new_fmt.build(_wb.add_format()))
-                else:
-                    _ws.write_blank(r, col + root_depth - item.depth, None, new_fmt.build(_wb.add_format()))
+        children: list = item.children
+        if len(children) > 0:
+            edge: tuple = (col + root_depth - item.depth, item.name if logparent else None, self._derivedFormat(_wb, fmt, True))
+            child_edges: list = list(edges) + [edge]
+            for child in children:
+                row = self._writeOutput(child, _wb, _ws, row + 1, col, root_depth, fmt_file, fmt_dir, fields, logparent, child_edges)
         return row 
     
-    def _printDirectory(self, folder: IOFolder, depth: int = 0, separator: str = ' ', fields: list = None, do_print: bool = True):
+    def _printItem(self, item: IOItem, depth: int, separator: str, fields: tuple, do_print: bool):
+        item.status = not item.failed
+        line: str = f'{(depth-item.depth) * separator}{item.name}'
         if not do_print: #Only evaluate
-            line = f'{(depth-folder.depth) * separator}{folder.name}'
-            if self._fields_size.get(S_Sharp) < len(line):
+            if self._fields_size[S_Sharp] < len(line):
                 self._fields_size[S_Sharp] = len(line)
-            
-            if S_Name in fields:
-                if S_Name in self._fields_size:
-                    if self._fields_size.get(S_Name) < len(folder.name):
-                        self._fields_size[S_Name] = len(folder.name)
-                else:
-                    self._fields_size[S_Name] = len(folder.name)
-            
-            if S_Path in fields:
-                if S_Path in self._fields_size:
-                    if self._fields_size.get(S_Path) < len(folder.path):
-                        self._fields_size[S_Path] = len(folder.path)
-                else:
-                    self._fields_size[S_Path] = len(folder.path)
-            
-            if S_Fullpath in fields:
-                if S_Path in self._fields_size:
-                    if self._fields_size.get(S_Fullpath) < len(folder.full_path):
-                        self._fields_size[S_Fullpath] = len(folder.full_path)
-                else:
-                    self._fields_size[S_Fullpath] = len(folder.full_path)
-            
-            if S_Type in fields:
-                if S_Type in self._fields_size:
-                    if self._fields_size.get(S_Type) < len(folder.kind.name):
-                        self._fields_size[S_Type] = len(folder.kind.name)
-                else:
-                    self._fields_size[S_Type] = len(folder.kind.name)
-
-            if S_Size in fields:
-                if S_Size in self._fields_size:
-                    if self._fields_size.get(S_Size) < len(str(folder.size)):
-                        self._fields_size[S_Size] = len(str(folder.size))
-                else:
-                    self._fields_size[S_Size] = len(str(folder.size))
-
-            if S_Extension in fields:
-                if S_Extension in self._fields_size:
-                    if self._fields_size.get(S_Extension) < len(folder.kind.name):
-                        self._fields_size[S_Extension] = len(folder.kind.name)
-                else:
-                    self._fields_size[S_Extension] = len(folder.kind.name)
+            for field in fields:
+                width: int = len(field.text(item))
+                if self._fields_size[field.name] < width:
+                    self._fields_size[field.name] = width
         else: #Print
-            line = f'{(depth-folder.depth) * separator}{folder.name}'
             if len(fields) > 0:#There are more fields to print -> Add space to right
                 line += separator * (self._fields_size[S_Sharp] - len(line) + len(separator))
-            if S_Name in fields:
-                line += folder.name
-                line += separator * (self._fields_size[S_Name] - len(folder.name) + len(separator))
-            if S_Path in fields:
-                line += folder.path
-                line += separator * (self._fields_size[S_Path] - len(folder.path) + len(separator))
-            if S_Fullpath in fields:
-                line += folder.full_path
-                line += separator * (self._fields_size[S_Fullpath] - len(folder.full_path) + len(separator))
-            if S_Type in fields:
-                line += folder.kind.name
-                line += separator * (self._fields_size[S_Type] - len(folder.kind.name) + len(separator))
-            if S_Size in fields:
-                line += str(folder.size)
-                line += separator * (self._fields_size[S_Size] - len(str(folder.size)) + len(separator))
-            if S_Extension in fields:
-                line += folder.extension
+            last: int = len(fields) - 1
+            for i, field in enumerate(fields):
+                text: str = field.text(item)
+                line += text
+                if i < last:
+                    line += separator * (self._fields_size[field.name] - len(text) + len(separator))
             print(line)
 
-        folder.status = True
-
+    def _printDirectory(self, folder: IOFolder, depth: int = 0, separator: str = ' ', fields: tuple = (), do_print: bool = True):
+        self._printItem(folder, depth, separator, fields, do_print)
         for child in folder.children:
             if child.kind == IOKind.DIR:
                 self._printDirectory(child, depth, separator, fields, do_print)
             else:
-                if not do_print: #Only evaluate
-                    line = f'{(depth-child.depth) * separator}{child.name}'
-                    if self._fields_size.get(S_Sharp) < len(line):
-                        self._fields_size[S_Sharp] = len(line)
-                    
-                    if S_Name in fields:
-                        if S_Name in self._fields_size:
-                            if self._fields_size.get(S_Name) < len(child.name):
-                                self._fields_size[S_Name] = len(child.name)
-                        else:
-                            self._fields_size[S_Name] = len(child.name)
-                    
-                    if S_Path in fields:
-                        if S_Path in self._fields_size:
-                            if self._fields_size.get(S_Path) < len(child.path):
-                                self._fields_size[S_Path] = len(child.path)
-                        else:
-                            self._fields_size[S_Path] = len(child.path)
-                    
-                    if S_Fullpath in fields:
-                        if S_Path in self._fields_size:
-                            if self._fields_size.get(S_Fullpath) < len(child.full_path):
-                                self._fields_size[S_Fullpath] = len(child.full_path)
-                        else:
-                            self._fields_size[S_Fullpath] = len(child.full_path)
-                    
-                    if S_Type in fields:
-                        if S_Type in self._fields_size:
-                            if self._fields_size.get(S_Type) < len(child.kind.name):
-                                self._fields_size[S_Type] = len(child.kind.name)
-                        else:
-                            self._fields_size[S_Type] = len(child.kind.name)
+                self._printItem(child, depth, separator, fields, do_print)
 
-                    if S_Size in fields:
-                        if S_Size in self._fields_size:
-                            if self._fields_size.get(S_Size) < len(str(child.size)):
-                                self._fields_size[S_Size] = len(str(child.size))
-                        else:
-                            self._fields_size[S_Size] = len(str(child.size))
+class RenderCommand(PrintCommand):
+    def __init__(self, dir: str = '') -> None:
+        super().__init__(dir, 'render', 'Print a snapshot saved with --save-snapshot, without walking')
 
-                    if S_Extension in fields:
-                        if S_Extension in self._fields_size:
-                            if self._fields_size.get(S_Extension) < len(child.kind.name):
-                                self._fields_size[S_Extension] = len(child.kind.name)
-                        else:
-                            self._fields_size[S_Extension] = len(child.kind.name)
-                else: #Print
-                    line = f'{(depth-child.depth) * separator}{child.name}'
-                    if len(fields) > 0:#There are more fields to print -> Add space to right
-                        line += separator * (self._fields_size[S_Sharp] - len(line) + len(separator))
-                    if S_Name in fields:
-                        line += child.name
-                        line += separator * (self._fields_size[S_Name] - len(child.name) + len(separator))
-                    if S_Path in fields:
-                        line += child.path
-                        line += separator * (self._fields_size[S_Path] - len(child.path) + len(separator))
-                    if S_Fullpath in fields:
-                        line += child.full_path
-                        line += separator * (self._fields_size[S_Fullpath] - len(child.full_path) + len(separator))
-                    if S_Type in fields:
-                        line += child.kind.name
-                        line += separator * (self._fields_size[S_Type] - len(child.kind.name) + len(separator))
-                    if S_Size in fields:
-                        line += str(child.size)
-                        line += separator * (self._fields_size[S_Size] - len(str(child.size)) + len(separator))
-                    if S_Extension in fields:
-                        line += child.extension
-                    print(line)
-                
-                child.status = True
-        
+    def accepts(self, path: str) -> bool:
+        return os.path.isfile(path)
+
+    def _collapse_roots(self, dirs: list) -> list:
+        return list(dirs)
+
+    def _onExecute(self) -> bool:
+        completed: bool = False
+        started: float = time.monotonic()
+        try:
+            sources: list = list(self.directories)
+            self._dirs = []
+            for d in sources:
+                roots, name, counters = IOSnapshot(d.full_path).load(self)
+                self._dirs += roots
+                self._dir_count += counters[0]
+                self._file_count += counters[1]
+                self._link_count += counters[2]
+            self._dir = self._dirs[0] if len(self._dirs) > 0 else None
+            completed = True
+        except Exception as ex:
+            print(ex)
+            return False
+        finally:
+            self._save_metrics(completed, started)
+        return self._export()
+
+class DiffCommand(Command):
+    """
+    Compare two walks: two snapshots, or a snapshot and a live directory.
+    Folders whose fingerprints match are skipped without looking at their children.
+    """
+    S_Added: str = 'Added'
+    S_Removed: str = 'Removed'
+    S_Resized: str = 'Resized'
+    S_Modified: str = 'Modified'
+
+    def __init__(self, dir: str = '') -> None:
+        super().__init__('diff', 'Compare two snapshots, or a snapshot and a directory', dir)
+        self._changes: list = []
+        self._skipped: int = 0
+
+    def accepts(self, path: str) -> bool:
+        return os.path.isfile(path) or os.path.isdir(path)
+
+    def _collapse_roots(self, dirs: list) -> list:
+        return list(dirs)
+
+    def _walk_like(self, snapshot: IOSnapshot):
+        """
+        Walk directories with the options `snapshot` was made with, so that what
+        they pruned is not reported as removed. Options given on the command
+        line must agree with them.
+        """
+        current: dict = self._walk_options()
+        for key, val in snapshot.options.items():
+            if key not in current:
+                continue
+            given: bool = current[key] is not None and current[key] is not False
+            if given and current[key] != val:
+                raise ValueError(f'{snapshot.file} was walked with {key} = {val}, not {current[key]}')
+            if isinstance(val, bool):
+                # Flags are store_false options: False when given, None otherwise
+                setattr(self.options, key, False if val else None)
+            else:
+                setattr(self.options, key, val)
+        self._excludes = None
+
+    def _change(self, change: str, old: IOItem, new: IOItem):
+        item: IOItem = new if new is not None else old
+        self._changes.append((change, item.kind.name, item.full_path, 0 if old is None else old.size, 0 if new is None else new.size))
+
+    def _compare(self, old: IOItem, new: IOItem):
+        if old.size == new.size and old.fingerprint == new.fingerprint:
+            self._skipped += 1
+            return
+        olds: dict = {}
+        for child in old.children:
+            olds[child.name] = child
+        for child in new.children:
+            prev: IOItem = olds.pop(child.name, None)
+            if prev is None:
+                self._change(DiffCommand.S_Added, None, child)
+            elif prev.kind != child.kind:
+                self._change(DiffCommand.S_Removed, prev, None)
+                self._change(DiffCommand.S_Added, None, child)
+            elif child.kind == IOKind.DIR:
+                self._compare(prev, child)
+            elif prev.size != child.size:
+                self._change(DiffCommand.S_Resized, prev, child)
+            elif round(prev.mtime * 1e6) != round(child.mtime * 1e6):
+                self._change(DiffCommand.S_Modified, prev, child)
+        for prev in olds.values():
+            self._change(DiffCommand.S_Removed, prev, None)
+
+    def _onExecute(self) -> bool:
+        completed: bool = False
+        started: float = time.monotonic()
+        self._top_dirs = [] if self.options.metrics_file is not None else None
+        try:
+            if len(self.directories) != 2:
+                print('diff needs exactly two inputs: old and new')
+                return False
+            sources: list = self.directories
+            snapshots: list = [None if os.path.isdir(source.full_path) else IOSnapshot(source.full_path) for source in sources]
+            loaded: list = [snapshot.load(self)[0] if snapshot is not None else None for snapshot in snapshots]
+            for snapshot in snapshots:
+                if snapshot is not None and snapshot.options is not None and None in loaded:
+                    self._walk_like(snapshot)
+                    break
+            for i in range(len(sources)):
+                if loaded[i] is None:
+                    loaded[i] = [self._walk(sources[i])]
+                else:
+                    sources[i].size = sum([root.size for root in loaded[i]])
+            olds, news = loaded
+            self._changes = []
+            self._skipped = 0
+            for i in range(max(len(olds), len(news))):
+                if i >= len(news):
+                    self._change(DiffCommand.S_Removed, olds[i], None)
+                elif i >= len(olds):
+                    self._change(DiffCommand.S_Added, None, news[i])
+                else:
+                    self._compare(olds[i], news[i])
+            print()
+            if self.options.output is None:
+                self._printChanges()
+            else:
+                self._writeChanges()
+            completed = True
+        except Exception as ex:
+            print(ex)
+            return False
+        finally:
+            self._save_metrics(completed, started)
+        return True
+
+    def _summary(self) -> str:
+        counts: dict = {}
+        delta: int = 0
+        for change, kind, path, old_size, new_size in self._changes:
+            counts[change] = counts.get(change, 0) + 1
+            delta += new_size - old_size
+        text: str = ', '.join([f'{counts.get(c, 0)} {c.lower()}' for c in [DiffCommand.S_Added, DiffCommand.S_Removed, DiffCommand.S_Resized, DiffCommand.S_Modified]])
+        return f'{text}; size change {delta:+d} bytes ({self._skipped} identical folders skipped)'
+
+    def _printChanges(self):
+        widths: list = [len(S_Result), len(S_Type), len(S_Fullpath), len(S_Size), len(S_Size)]
+        for row in self._changes:
+            for i in range(len(widths)):
+                widths[i] = max(widths[i], len(str(row[i])))
+        line: str = ''
+        for i, title in enumerate([S_Result, S_Type, S_Fullpath, 'Old ' + S_Size, 'New ' + S_Size]):
+            line += title.ljust(widths[i] + 4) + ' '
+        print(line.rstrip())
+        for row in self._changes:
+            print(' '.join([str(row[i]).ljust(widths[i] + 4) for i in range(len(widths))]).rstrip())
+        print()
+        print(self._summary())
+
+    def _writeChanges(self):
+        _wb: xlsxwriter.Workbook = _open_workbook(self.options.output)
+        _ws: xlsxwriter.worksheet.Worksheet = _wb.add_worksheet(self.name)
+        hdr_fmt = XlsHeaderFormat(_wb.add_format()).build()
+        fmts: dict = {}
+        for change, color in [(DiffCommand.S_Added, '#E2EFDA'), (DiffCommand.S_Removed, '#FCE4D6'), (DiffCommand.S_Resized, '#FFF2CC'), (DiffCommand.S_Modified, '#DDEBF7')]:
+            fmt = XlsCellFormat(_wb.add_format())
+            fmt.border.top.style = XlsBorderStyle.CONTINUOUS
+            fmt.border.left.style = XlsBorderStyle.CONTINUOUS
+            fmt.border.right.style = XlsBorderStyle.CONTINUOUS
+            fmt.border.bottom.style = XlsBorderStyle.CONTINUOUS
+            fmt.fill.style = XlsFillStyle.SOLID
+            fmt.fill.color = color
+            fmts[change] = fmt.build()
+        for col, title in enumerate([S_Result, S_Type, S_Fullpath, 'Old ' + S_Size, 'New ' + S_Size]):
+            _ws.write(0, col, title, hdr_fmt)
+        for row, values in enumerate(self._changes, 1):
+            for col, val in enumerate(values):
+                _ws.write(row, col, val, fmts[values[0]])
+        _ws.write(len(self._changes) + 2, 0, self._summary())
+        _wb.close()
+        print(self._summary())
+
+class SummaryCommand(Command):
+    def __init__(self, dir: str = '') -> None:
+        super().__init__('summary', 'Summarize bytes and file count per extension, top-level directory and depth', dir)
+        self._summary: IOSummary = None
+
+    def _onAddOptions(self, parser: optparse.OptionParser):
+        super()._onAddOptions(parser)
+        parser.add_option('--top', type='int', help='Only show the N largest groups of each table')
+
+    def _onExecute(self) -> bool:
+        self._summary = IOSummary(len(self.directories) > 1)
+        self._sink = self._summary
+        self._release_tree = self.options.save_snapshot is None
+        try:
+            if not super()._onExecute():
+                return False
+        finally:
+            self._sink = None
+        try:
+            tables: list = self._tables()
+            print()
+            if self.options.output is None:
+                for title, rows in tables:
+                    self._printTable(title, rows)
+            else:
+                self._writeTables(tables)
+        except Exception as ex:
+            print(ex)
+            return False
+        return True
+
+    def _tables(self) -> list:
+        tables: list = []
+        for title, groups, key in [(S_Extension, self._summary.extensions, lambda row: -row[2]),
+                                   ('Top-level directory', self._summary.tops, lambda row: -row[2]),
+                                   ('Depth', self._summary.depths, lambda row: row[0])]:
+            rows: list = sorted([(k, v[0], v[1], v[2]) for k, v in groups.items()], key=key)
+            if self.options.top is not None and groups is not self._summary.depths:
+                rows = rows[:self.options.top]
+            tables.append((title, rows))
+        return tables
+
+    def _printTable(self, title: str, rows: list):
+        headers: list = [title, 'Files', 'Bytes', 'Dirs']
+        widths: list = [len(h) for h in headers]
+        for row in rows:
+            for i in range(len(widths)):
+                widths[i] = max(widths[i], len(str(row[i])))
+        print('  '.join([headers[0].ljust(widths[0])] + [headers[i].rjust(widths[i]) for i in range(1, len(headers))]))
+        print('  '.join(['-' * w for w in widths]))
+        for row in rows:
+            print('  '.join([str(row[0]).ljust(widths[0])] + [str(row[i]).rjust(widths[i]) for i in range(1, len(row))]))
+        print()
+
+    def _writeTables(self, tables: list):
+        _wb: xlsxwriter.Workbook = _open_workbook(self.options.output)
+        _ws: xlsxwriter.worksheet.Worksheet = _wb.add_worksheet(self.name)
+        hdr_fmt = XlsHeaderFormat(_wb.add_format()).build()
+        cell = XlsCellFormat(_wb.add_format())
+        cell.border.top.style = XlsBorderStyle.CONTINUOUS
+        cell.border.bottom.style = XlsBorderStyle.CONTINUOUS
+        cell.border.left.style = XlsBorderStyle.CONTINUOUS
+        cell.border.right.style = XlsBorderStyle.CONTINUOUS
+        cell_fmt = cell.build()
+        # Tables side by side, with one empty column between them
+        col: int = 0
+        for title, rows in tables:
+            for j, header in enumerate([title, 'Files', 'Bytes', 'Dirs']):
+                _ws.write(0, col + j, header, hdr_fmt)
+            for i, row in enumerate(rows, 1):
+                for j, val in enumerate(row):
+                    _ws.write(i, col + j, val, cell_fmt)
+            col += 5
+        _wb.close()
+
+class EstimateCommand(Command):
+    """
+    Estimate directory/file/link counts and total size by random probes
+    (Knuth's estimator): each probe descends one random path from the root and
+    extrapolates what it lists by the product of the branching factors seen on
+    the way. The mean of all probes is an unbiased estimate of the totals and
+    their spread gives the confidence interval.
+    """
+    def __init__(self, dir: str = '') -> None:
+        super().__init__('estimate', 'Estimate item count and size by sampling random subtrees', dir)
+        self._listings: dict = {}
+        self._listed: int = 0
+
+    def _onAddOptions(self, parser: optparse.OptionParser):
+        super()._onAddOptions(parser)
+        parser.add_option('--time-budget', type='float', help='Stop sampling after this many seconds. Default is 10 when no budget is given')
+        parser.add_option('--entry-budget', type='int', help='Stop sampling after listing this many entries')
+        parser.add_option('--probes', type='int', default=10000, help='Maximum number of random probes per directory. Default is 10000')
+        parser.add_option('--seed', type='int', help='Seed of the random generator, for reproducible estimates')
+
+    def _list(self, path: str) -> tuple:
+        listing: tuple = self._listings.get(path)
+        if listing is not None:
+            return listing
+        dirs: int = 0
+        files: int = 0
+        links: int = 0
+        size: int = 0
+        subdirs: list = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    self._listed += 1
+                    if self._is_excluded(entry.name):
+                        continue
+                    if entry.is_symlink():
+                        links += 1
+                    elif entry.is_dir(follow_symlinks=False):
+                        dirs += 1
+                        if self.options.one_file_system is not None and entry.stat(follow_symlinks=False).st_dev != self._root_dev:
+                            continue
+                        subdirs.append(entry.path)
+                    else:
+                        files += 1
+                        size += entry.stat(follow_symlinks=False).st_size
+        except OSError as ex:
+            if self.options.verbose is not None:
+                print(ex)
+        listing = (dirs, files, links, size, subdirs)
+        self._listings[path] = listing
+        return listing
+
+    def _probe(self, root: str, rnd: random.Random) -> tuple:
+        path: str = root
+        weight: int = 1
+        totals: list = [0, 0, 0, 0]
+        while True:
+            listing: tuple = self._list(path)
+            for i in range(4):
+                totals[i] += weight * listing[i]
+            subdirs: list = listing[4]
+            if len(subdirs) == 0 or self.options.recursive is None:
+                break
+            weight *= len(subdirs)
+            path = rnd.choice(subdirs)
+        return tuple(totals)
+
+    def _estimate(self, root: IOFolder, rnd: random.Random, deadline: float) -> list:
+        import statistics
+        self._print_walking(root)
+        self._root_dev = os.stat(root.full_path).st_dev
+        samples: list = []
+        while len(samples) < self.options.probes:
+            samples.append(self._probe(root.full_path, rnd))
+            if len(samples) < 2:
+                continue
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            if self.options.entry_budget is not None and self._listed >= self.options.entry_budget:
+                break
+        results: list = []
+        for i in range(4):
+            values: list = [x[i] for x in samples]
+            mean: float = statistics.fmean(values)
+            error: float = 0.0
+            if len(values) > 1:
+                error = 1.96 * statistics.stdev(values) / math.sqrt(len(values))
+            results.append((mean, error))
+        print()
+        print(f'{root.full_path}: {len(samples)} probes, {len(self._listings)} directories listed')
+        return results
+
+    def _onExecute(self) -> bool:
+        import random
+        completed: bool = False
+        started: float = time.monotonic()
+        try:
+            rnd: random.Random = random.Random(self.options.seed)
+            budget = self.options.time_budget
+            if budget is None and self.options.entry_budget is None:
+                budget = 10
+            totals: list = [(0.0, 0.0)] * 4
+            for root in self.directories:
+                deadline: float = None
+                if budget is not None:
+                    deadline = time.monotonic() + budget / len(self.directories)
+                self._listings = {}
+                results: list = self._estimate(root, rnd, deadline)
+                root.size = round(results[3][0])
+                # Roots are sampled independently, so their variances add up
+                totals = [(totals[i][0] + results[i][0], math.hypot(totals[i][1], results[i][1])) for i in range(4)]
+            self._dir_count = round(totals[0][0])
+            self._file_count = round(totals[1][0])
+            self._link_count = round(totals[2][0])
+            print(f'Sampled {self._listed} entries in {time.monotonic() - started:.1f}s (95% confidence)')
+            for label, (mean, error) in zip(['Directories', 'Files', 'Links', 'Size'], totals):
+                print(f'  {label:<12}{round(mean):>16} \u00b1 {round(error):<12} [{max(0, round(mean - error))} - {round(mean + error)}]')
+            completed = True
+        except Exception as ex:
+            print(ex)
+            return False
+        finally:
+            self._save_metrics(completed, started)
+        return True
+
+class WorkerCommand(Command):
+    """
+    Walk shards for a coordinator (a command run with --coordinator): connect to
+    it, take the walk options from it, and walk the shards it hands out one at a
+    time, each sent back as a snapshot of its subtree. The directory is where
+    the coordinator's directory is mounted on this host.
+    """
+    def __init__(self, dir: str = '') -> None:
+        super().__init__('worker', 'Walk shards handed out by a coordinator (see --coordinator)', dir)
+
+    def _onAddOptions(self, parser: optparse.OptionParser):
+        super()._onAddOptions(parser)
+        parser.add_option('--connect', help='Address of the coordinator: host:port or unix:path')
+
+    def _connect(self):
+        import socket
+        family, address = _socket_address(self.options.connect)
+        # The coordinator may not be listening yet
+        deadline: float = time.monotonic() + self.options.worker_timeout
+        while True:
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            try:
+                sock.connect(address)
+            except OSError:
+                sock.close()
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.5)
+                continue
+            if family != socket.AF_UNIX:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            return sock
+
+    def _onExecute(self) -> bool:
+        import socket
+        if self.options.connect is None:
+            print('worker needs the --connect address of a coordinator')
+            return False
+        channel: IOChannel = None
+        count: int = 0
+        completed: bool = False
+        started: float = time.monotonic()
+        try:
+            channel = IOChannel(self._connect())
+            channel.send({'op': 'hello', 'token': os.environ.get('WALKDIR_TOKEN', S_Empty), 'host': socket.gethostname(), 'pid': os.getpid()})
+            msg, _ = channel.recv(0)
+            if msg.get('op') != 'welcome':
+                raise ConnectionError(f'Rejected by the coordinator: {msg.get("reason")}')
+            options: dict = msg['options']
+            channel.heartbeat(msg['heartbeat'])
+            while True:
+                msg, _ = channel.recv(0)
+                if msg.get('op') != 'shard':
+                    break
+                name: str = msg['name']
+                subtree, counters, errors = self._walk_shard(self.directory.full_path, name, options)
+                channel.send({'op': 'result', 'name': name, 'errors': errors}, IOSnapshot(name).dumps([subtree], self.name, counters))
+                self._dir_count += counters[0]
+                self._file_count += counters[1]
+                self._link_count += counters[2]
+                self.directory.size += subtree.size
+                count += 1
+            print(f'\n{count} shards are walked for {self.options.connect}')
+            completed = True
+        except Exception as ex:
+            print(ex)
+            return False
+        finally:
+            if channel is not None:
+                channel.close()
+            self._save_metrics(completed, started)
+        return True
+
+class IOAsyncWalk:
+    """
+    Asynchronous walk of one directory, returned by awalk().
+    Iterating it yields the root folder first and then every IOItem as soon as
+    the listing of its directory completes (parents always before their
+    children). Listings run on a pool of `jobs` threads and at most `jobs` of
+    them are in flight: no new listing is started while the consumer is not
+    asking for items, so a slow consumer holds the walk back instead of
+    buffering it. Folder sizes and depths are final once iteration ends.
+    Cancelling the task stops the walk at once, leaving the loop early stops it
+    when the generator is closed (right away under contextlib.aclosing).
+    Listings that already started finish in the background and are discarded.
+    """
+    def __init__(self, root: str, jobs: int = 4, options: list = None) -> None:
+        self._cmd: Command = Command('awalk')
+        if not self._cmd.parse_args(['-r'] + (options if options is not None else [])):
+            raise ValueError(f'Invalid walk options: {options}')
+        _path, _name = os.path.split(os.path.abspath(root))
+        self._root: IOFolder = IOFolder(_name, _path)
+        self._jobs: int = max(1, jobs)
+
+    @property
+    def root(self) -> IOFolder:
+        return self._root
+
+    @property
+    def dir_count(self) -> int:
+        return self._cmd.dir_count
+
+    @property
+    def file_count(self) -> int:
+        return self._cmd.file_count
+
+    @property
+    def link_count(self) -> int:
+        return self._cmd.link_count
+
+    @property
+    def errors(self) -> dict:
+        return self._cmd._errors
+
+    def _list(self, folder: IOFolder) -> list:
+        return self._cmd._call_timed(folder, self._cmd._scan_path, folder.full_path)
+
+    def _add(self, folder: IOFolder, current: IOItem):
+        # Sizes and depths are pushed up the whole chain at once: unlike the
+        # synchronous walk, a folder is not complete when its own listing is
+        current.parent = folder
+        folder.children.append(current)
+        node: IOItem = current
+        while node.parent is not None:
+            node.parent.size += current.size
+            if node.parent.depth <= node.depth:
+                node.parent.depth = node.depth + 1
+            node = node.parent
+
+    async def __aiter__(self):
+        import asyncio
+        import concurrent.futures
+        cmd: Command = self._cmd
+        cmd._errors = {}
+        if cmd.options.dir_timeout is not None:
+            cmd._listing_slots = threading.BoundedSemaphore(max(1, cmd.options.max_listings))
+        loop = asyncio.get_running_loop()
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=self._jobs, thread_name_prefix='awalk')
+        running: dict = {}
+        try:
+            root: IOFolder = self._root
+            try:
+                st: os.stat_result = await loop.run_in_executor(pool, os.stat, root.full_path)
+            except OSError as ex:
+                cmd._onError(root, ex)
+                yield root
+                return
+            root.set_stat(st)
+            cmd._root_dev = st.st_dev
+            cmd._visited = {(st.st_dev, st.st_ino): root.full_path}
+            cmd._real_root = os.path.realpath(root.full_path) if cmd.options.follow_links is not None else None
+            yield root
+            stack: list = [root]
+            while len(stack) > 0 or len(running) > 0:
+                while len(stack) > 0 and len(running) < self._jobs:
+                    folder: IOFolder = stack.pop()
+                    running[loop.run_in_executor(pool, self._list, folder)] = folder
+                done, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for fut in done:
+                    folder: IOFolder = running.pop(fut)
+                    try:
+                        entries: list = fut.result()
+                    except OSError as ex:
+                        cmd._onError(folder, ex)
+                        continue
+                    for name, kind, st in entries:
+                        error: OSError = None
+                        if isinstance(st, OSError):
+                            error = st
+                            st = None
+                        current: IOItem = cmd._new_item(folder, name, kind, st)
+                        if error is not None:
+                            cmd._onError(current, error)
+                        elif kind == IOKind.DIR and cmd._can_descend(current, st):
+                            stack.append(current)
+                        self._add(folder, current)
+                        yield current
+        finally:
+            for fut in running:
+                fut.cancel()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+def awalk(root: str, jobs: int = 4, options: list = None) -> IOAsyncWalk:
+    """
+    Walk `root` without blocking the event loop:
+
+        walk = awalk('/data', jobs=8, options=['-x', '*.tmp'])
+        async for item in walk:
+            ...
+        print(walk.file_count, walk.errors)
+
+    `options` are the walk options of the command line (-x, -L,
+    --one-file-system, --dir-timeout, ...). The walk is always recursive.
+    """
+    return IOAsyncWalk(root, jobs, options)
 
 if __name__=="__main__":
     #Initialize supported commands
@@ -1136,49 +4023,80 @@ if __name__=="__main__":
     initCmd: PrintCommand = PrintCommand()
     commands[initCmd.name] = initCmd
 
+    estimateCmd: EstimateCommand = EstimateCommand()
+    commands[estimateCmd.name] = estimateCmd
+
+    renderCmd: RenderCommand = RenderCommand()
+    commands[renderCmd.name] = renderCmd
+
+    diffCmd: DiffCommand = DiffCommand()
+    commands[diffCmd.name] = diffCmd
+
+    summaryCmd: SummaryCommand = SummaryCommand()
+    commands[summaryCmd.name] = summaryCmd
+
+    workerCmd: WorkerCommand = WorkerCommand()
+    commands[workerCmd.name] = workerCmd
+
     help: str = ''
     for c in commands.values():
         help += f'\n  {c.name}:    {c.description}'
-    parser: optparse.OptionParser = optparse.OptionParser(usage='%prog directory command [options]\n\nCommands:    '+ help)
-    errno: int = 1
+    parser: optparse.OptionParser = optparse.OptionParser(usage='%prog directory [directory ...] [--] command [options]\n\nA -- ends the directory list, for directories named like a command.\n\nCommands:    '+ help)
+    exit_code: int = 1
 
     args = sys.argv[1::]
     if len(args) <= 0:
         parser.print_help()
         exit(0)
     
-    dir = args[0]
-    if dir == '-h' or dir == '--help':
+    if args[0] == '-h' or args[0] == '--help':
         parser.print_help()
         exit(0)
 
-    temp: str = os.path.abspath(dir)
-    if not os.path.isdir(temp):
-        print(f'{dir} is not a directory')
-        exit(1)
+    # The first argument is always a directory; the ones after it are too, up
+    # to the command or to a -- that ends the list
+    dirs: list = []
+    pos: int = 0
+    if '--' in args[:-1] and args[args.index('--') + 1] in commands:
+        dirs = args[:args.index('--')]
+        pos = len(dirs) + 1
     else:
-        dir = temp
+        while pos < len(args) and (pos == 0 or args[pos] not in commands):
+            dirs.append(args[pos])
+            pos += 1
 
-    if len(args) < 2:
+    if len(dirs) <= 0:
+        print('Error: No directory specified')
+        parser.print_help()
+        exit(0)
+
+    if pos >= len(args):
         print('Error: No command specified')
         parser.print_help()
         exit(0)
-    cmd =  args[1]
+    cmd =  args[pos]
     command: Command = None
     if cmd in commands:
         command = commands[cmd]
     
     if command is None:
         print(f'Unknown command "{cmd}"')
-        errno+=1
-        exit(errno)
+        exit_code+=1
+        exit(exit_code)
+
+    for i in range(len(dirs)):
+        temp: str = os.path.abspath(dirs[i])
+        if not command.accepts(temp):
+            print(f'{dirs[i]} is not a directory')
+            exit(1)
+        dirs[i] = temp
     
-    options = args[2::]
+    options = args[pos+1::]
     if not command.parse_args(options):
-        errno+=1
-        exit(errno)
+        exit_code+=1
+        exit(exit_code)
     
-    if command.execute(dir):
+    if command.execute(dirs):
         exit(0)
     else:
         exit(-1)
\ No newline at end of file